@@ -0,0 +1,79 @@
+import numpy as np
+
+TRAITS = ['O', 'C', 'E', 'A', 'N']
+
+
+class AgentStore:
+    """
+    State of the pedestrians as a structure of arrays: one contiguous column per attribute, row i being
+    the agent of slot i. Slots are given in the order the agents are created (RandomActivation reshuffles
+    its agents at each step, so the order of the scheduler has to be read from the scheduler itself).
+
+    PedestrianAgent reads and writes its attributes in its row (cf. agents.PedestrianAgent), while the
+    model-wide phases (relationships, clustering, contagion) work on whole columns.
+
+    Columns:
+    - unique_id : int, the unique id of the agent of the slot
+    - active : bool, whether the agent is on the grid
+    - pos : int, N x 2, the position of the agent (-1, -1 when it is not on the grid)
+    - vel : int, N x 2, the last move of the agent along each axis (cf. equation 5)
+    - vel0 : int, the maximal speed of the agent
+    - pd, pv, initial_pd, initial_pv : float, the preferred distance and velocity, now and at creation
+    - p : int, the collective density of the agent (cf. equation 9)
+    - neigh : int, the unique id of the center of the cluster of the agent
+    - traits : float, N x 5, the personality of the agent (columns O C E A N)
+    """
+
+    COLUMNS = {
+        "unique_id": (np.int64, ()),
+        "active": (bool, ()),
+        "pos": (np.int64, (2,)),
+        "vel": (np.int64, (2,)),
+        "vel0": (np.int64, ()),
+        "pd": (float, ()),
+        "pv": (float, ()),
+        "initial_pd": (float, ()),
+        "initial_pv": (float, ()),
+        "p": (np.int64, ()),
+        "neigh": (np.int64, ()),
+        "traits": (float, (len(TRAITS),)),
+    }
+
+    def __init__(self, capacity=0):
+        self.size = 0 # number of slots given
+        self.slot_of = {} # key: unique id, value: slot
+        self.agents = [] # the agent of each slot
+        for name, (dtype, shape) in self.COLUMNS.items():
+            setattr(self, name, np.zeros((max(capacity, 1),) + shape, dtype=dtype))
+        self.pos[:] = -1
+
+
+    def add(self, agent, unique_id):
+        """
+        Give the next slot to the agent unique_id and return it, growing the columns if needed
+        """
+        if self.size == len(self.unique_id):
+            self._grow(2 * self.size)
+        slot = self.size
+        self.size += 1
+        self.slot_of[unique_id] = slot
+        self.agents.append(agent)
+        self.unique_id[slot] = unique_id
+        self.neigh[slot] = unique_id
+        return slot
+
+
+    def _grow(self, capacity):
+        """Reallocate every column with room for capacity slots"""
+        for name, (dtype, shape) in self.COLUMNS.items():
+            column = np.zeros((capacity,) + shape, dtype=dtype)
+            column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+        self.pos[self.size:] = -1
+
+
+    def active_slots(self):
+        """
+        Return the slots of the agents on the grid, in increasing order
+        """
+        return np.flatnonzero(self.active[:self.size])
@@ -2,8 +2,11 @@ from mesa import Agent
 from mesa.space import MultiGrid
 from obstacle import Obstacle
 from math import sqrt, exp
-from exit import Exit
+from agent_store import TRAITS
 import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
 
 def euclidean_dist(pt1, pt2):
     """ Return euclidean distance between two points """
@@ -39,8 +42,38 @@ def prefV_E(value):
     return 0
 
 
+def _column(name, cast):
+    """
+    Attribute of PedestrianAgent stored in a column of the AgentStore of the model, at the slot of the agent
+    """
+    def get(self):
+        return cast(getattr(self._store, name)[self.slot])
+
+    def set(self, value):
+        getattr(self._store, name)[self.slot] = value
+
+    return property(get, set)
+
+
 class PedestrianAgent(Agent):
-    def __init__(self, unique_id, model, personality, vel0=2):
+    """
+    Pedestrian whose state lives in the AgentStore of the model (cf. agent_store.py): its attributes are
+    read from and written to its slot, so that the model can work on the columns of all the agents at once
+    """
+    layer = "pedestrian" # cf. MultiGridWithProperties layers
+
+    pd = _column("pd", float)
+    pv = _column("pv", float)
+    initial_pd = _column("initial_pd", float)
+    initial_pv = _column("initial_pv", float)
+    p = _column("p", int)
+    neigh = _column("neigh", int)
+    vel0 = _column("vel0", int)
+
+    def __init__(self, unique_id, model, personality, vel0=2, preferences=None):
+        # The slot is needed before Agent.__init__, which sets the position
+        self._store = model.agent_store
+        self.slot = self._store.add(self, unique_id)
         super().__init__(unique_id, model)
         self.personality = personality  # dict whose keys ['O','C','E','A','N'] and values belong in [0;1]
         self.vel = (0,0)   # values required to compute the relationship matrix (cf equation 5)
@@ -49,11 +82,46 @@ class PedestrianAgent(Agent):
         self.neigh = unique_id
 
         self.vel0 = vel0  # should belong to {1, 2, 3}
-        self.fuzzy_preferences_vel_dist() # If we want to activate/desactivate the fuzzy model change this ligne
+        if preferences is not None:
+            self.pd, self.pv = preferences # (Pd, Pv) already computed by the model for all the agents at once
+        else:
+            self.fuzzy_preferences_vel_dist() # If we want to activate/desactivate the fuzzy model change this ligne
         self.initial_pd = self.pd    
         self.initial_pv = self.pv
 
 
+    @property
+    def pos(self):
+        # The tuple is kept along with the column, as the grid and the density scan read the position in tight loops
+        return self._pos
+
+    @pos.setter
+    def pos(self, pos):
+        self._pos = pos
+        self._store.active[self.slot] = pos is not None
+        self._store.pos[self.slot] = pos if pos is not None else (-1, -1)
+
+
+    @property
+    def vel(self):
+        vx, vy = self._store.vel[self.slot].tolist()
+        return (vx, vy)
+
+    @vel.setter
+    def vel(self, vel):
+        self._store.vel[self.slot] = vel
+
+
+    @property
+    def personality(self):
+        # A copy: the traits are only changed by assigning a whole personality
+        return dict(zip(TRAITS, self._store.traits[self.slot].tolist()))
+
+    @personality.setter
+    def personality(self, personality):
+        self._store.traits[self.slot] = [personality[trait] for trait in TRAITS]
+
+
     def preferences_vel_dist(self):
         """Compute prefered velocity Pv and prefered distance Pd"""
         O, C, E, A, N = (self.personality['O'], self.personality['C'],
@@ -70,7 +138,8 @@ class PedestrianAgent(Agent):
 
     def fuzzy_preferences_vel_dist(self):
         """
-        Compute P_v and P_d using the fuzzy model.
+        Compute P_v and P_d using the fuzzy model, one agent at a time: the reference of the computation
+        for all the agents at once done by CrowdModel (cf. FuzzyModel.compute_parameters_array)
         Args:
             O (float): Openness trait
             C (float): Conscientiousness trait
@@ -91,7 +160,7 @@ class PedestrianAgent(Agent):
             try:
                 pd, pv = self.model.fuzzy_model.compute_parameters(O,C,E,A,N)
             except Exception:
-                print("Error in fuzzy computation, using default parameters")
+                logger.debug("Error in fuzzy computation, using default parameters")
                 pd, pv = 1.5, 1.5
         else:
             pd, pv = 1.5, 1.5
@@ -114,6 +183,8 @@ class PedestrianAgent(Agent):
         On suppose pour l'instant que la fonction de scoring est suffisante pour cela.
         """
         grid = self.model.grid
+        blocked = grid.blocked_layer # number of agents other than exits in each cell
+        trajectories = self.model.trajectories.agent_ids # cells already crossed by an agent during this step
         loc = self.pos  #(x,y)
         speed = self.vel0   #int
 
@@ -129,19 +200,14 @@ class PedestrianAgent(Agent):
                 neighbor = (loc[0] + i*dir[0], loc[1] + i*dir[1])
 
                 # Insures the neighbor is part of the grid
-                if grid.out_of_bounds(neighbor):
+                if not (0 <= neighbor[0] < grid.width and 0 <= neighbor[1] < grid.height):
                     break
 
-                cell_agents = grid.get_cell_list_contents(neighbor)
-                
-                # Insures the neighbor is not an Obstacle or an Agent
-                if not grid.is_cell_empty(neighbor):
-                    cell_agents = grid.get_cell_list_contents(neighbor)
-
+                # Insures the neighbor is not an Obstacle or an Agent
                 # But if it is an Exit, we won't break so they can continue toward this direction and leave
-                    if any(not isinstance(agent, Exit) for agent in cell_agents):
-                        break  # We see the neighbor is either an Obstacle or an Agent but not an Exit
-                
+                if blocked[neighbor] or trajectories[neighbor] >= 0:
+                    break  # We see the neighbor is either an Obstacle, an Agent or a Trajectory but not an Exit
+
                 valid_neighbors.append(neighbor)
 
         valid_neighbors.append(loc)
@@ -168,6 +234,9 @@ class PedestrianAgent(Agent):
         - density : float, the density of pedestrians in the neighborhood of the cell
         """
 
+        if self.model.profiler is not None:
+            self.model.profiler.count("get_density")
+
         density_score = 0
 
         neighbors = self.model.grid.get_neighborhood(
@@ -211,9 +280,7 @@ class PedestrianAgent(Agent):
                 delta_pv += exp((neighbor.pv - self.pv) / dist)
 
         # selective perception
-        exits = self.model.exit # now exit is a list to handle multiple exits
-        dist_to_exits = [euclidean_dist(self.pos, exit) for exit in exits]
-        dist_to_goal = min(dist_to_exits)
+        dist_to_goal = float(self.model.exit_distance[self.pos]) # distance to the nearest exit
         vel = self.vel0
         omega_d = exp(-0.05 * dist_to_goal)
         omega_v = exp(-2.0 * vel)
@@ -236,43 +303,65 @@ class PedestrianAgent(Agent):
         """
         Compute the satisfaction score considering the agent moving on the next_cell.
         """
-        exits = self.model.exit # now exit is a list to handle multiple exits
-        dist_to_exits = [euclidean_dist(next_cell, exit) for exit in exits]
-        dist_to_exit = min(dist_to_exits)
+        dist_to_exit = float(self.model.goal_distance(*next_cell)) # distance to the nearest exit
 
         # We compute the density of the next cell
         if density is None: # gard rail in case there is code where density is not computed before
             density, _ = self.get_density(next_cell)
         
         return dist_to_exit / (self.vel0 * exp(- density * (self.pv+1 )/(self.pd+1)))
-    
-    
+
+
+    def choose_move(self, cells):
+        """
+        Batched version of the scoring of every candidate cell: densities and distances to the exits
+        are gathered for all the cells at once and the scores computed as a vector.
+
+        Return the index of the best cell (the first one in case of tie, as a sequential comparison would do)
+        and the real density of every cell.
+        """
+        xs, ys = np.array(cells).T
+        if self.model.density_field is not None:
+            densities, real_densities = self.model.density_field.densities(xs, ys)
+            if self.model.profiler is not None:
+                self.model.profiler.count("density_lookups", len(cells))
+        else:
+            densities, real_densities = np.array([self.get_density(cell) for cell in cells]).T
+
+        scores = self.model.goal_distance(xs, ys) / (self.vel0 * np.exp(- densities * (self.pv+1 )/(self.pd+1)))
+
+        # nan scores are never chosen, and an agent with no finite score stays in place (its cell is the last candidate)
+        scores[np.isnan(scores)] = np.inf
+        best = int(np.argmin(scores))
+        if not np.isfinite(scores[best]):
+            best = len(cells) - 1
+        return best, real_densities
+
+
     def step(self):
-        if self.pos in self.model.exit:
-            self.model.grid.remove_agent(self)  # The agent is removed from the grid
-            self.model.schedule.remove(self)
+        profiler = self.model.profiler
+        if self.model.grid.exit_layer[self.pos]:
+            self.model.remove_pedestrian(self)  # The agent is removed from the grid and the scheduler
             self.model.needed_steps_per_agents[self.unique_id] = self.model.nb_steps # Store the number of steps needed for this agent
+            if profiler is not None:
+                profiler.count("evacuated")
 
         else:
-            min_score = float('inf')
-            best_cell = None
-            density_of_best_cell = None
-            for cell in self.get_cells_around():
-                density, real_density = self.get_density(cell)
-                score = self.score(cell, density)
-
-                if score < min_score:
-                    min_score = score
-                    best_cell = cell
-                    density_of_best_cell = real_density
-            
+            cells = self.get_cells_around()
+            if profiler is not None:
+                profiler.count("agent_moves")
+                profiler.count("candidates", len(cells))
+            best, real_densities = self.choose_move(cells)
+            best_cell = cells[best]
+            density_of_best_cell = float(real_densities[best])
+
             # Store current speed (needed for relationship matrix)
             velx = abs(self.pos[0] - best_cell[0])
             vely = abs(self.pos[1] - best_cell[1])
             self.vel = (velx, vely)
 
             previous_cell = self.pos
-            self.model.grid.move_agent(self, best_cell)
+            self.model.move_pedestrian(self, best_cell)
             if self.model.max_density_per_episode < density_of_best_cell:
                 self.model.max_density_per_episode = density_of_best_cell
 
@@ -0,0 +1,182 @@
+"""
+Benchmark suite of CrowdModel: times the construction of the model and each phase of its steps
+(clearing of the trajectories, agents moves in schedule.step, update_relationships, coll_clustering_algo, emotion_contagion)
+on fixed-seed scenarios, for combinations of the feature flags.
+
+Usage:
+    python benchmark.py --suite quick --output benchmarks/current.json
+    python benchmark.py --suite quick --baseline benchmarks/baseline.json --threshold 0.25
+
+Results are written as JSON (the time in seconds of each phase for each case), which can be used as the
+baseline of a later run: the exit code is 1 when a phase is slower than in the baseline beyond the threshold.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from model import CrowdModel
+from scenario import generate_exits, random_personality
+
+FLAGS = ["use_fuzzy", "enable_emotions", "enable_relationships", "enable_clustering"]
+PHASES = ["construction", "trajectories", "agents", "relationships", "clustering", "emotions"]
+
+# (number of agents, grid size, number of exits, obstacles)
+SUITES = {
+    "quick": [
+        (100, 50, 4, False),
+        (100, 50, 0, True),
+        (1000, 200, 8, True),
+    ],
+    "full": [
+        (n_agents, size, n_exits, obstacles)
+        for n_agents in (100, 1000, 5000, 20000)
+        for size in (50, 200, 1000)
+        for n_exits in (0, 1, 4, 8)
+        for obstacles in (False, True)
+        if n_agents <= size * size // 2 # leave room to move
+    ],
+}
+
+
+def flag_combinations(which):
+    """Return the feature flags to benchmark: every combination ("all") or every feature on ("default")"""
+    if which == "default":
+        return [dict.fromkeys(FLAGS, True)]
+    return [dict(zip(FLAGS, values)) for values in itertools.product((True, False), repeat=len(FLAGS))]
+
+
+def case_key(n_agents, size, n_exits, obstacles, flags):
+    """Name of a case in the results"""
+    features = "+".join(flag.replace("use_", "").replace("enable_", "") for flag in FLAGS if flags[flag]) or "none"
+    return f"agents{n_agents}_grid{size}_exits{n_exits}_{'obstacles' if obstacles else 'open'}_{features}"
+
+
+def case_geometry(size, n_exits, obstacles):
+    """
+    Exits spread on the sides of a size x size grid (the first sides getting one more when n_exits is not
+    a multiple of 4), and a wall in the middle of the grid if obstacles
+    """
+    per_side = [n_exits // 4 + (side < n_exits % 4) for side in range(4)]
+    exit_pos = generate_exits(size, size, *per_side)
+    walls = [(size // 2, y) for y in range(size // 4, 3 * size // 4)] if obstacles else []
+    return exit_pos, walls
+
+
+def run_case(n_agents, size, n_exits, obstacles, flags, steps, seed=0, model_options=None):
+    """
+    Time the construction and the first steps of a model, return the time of each phase in seconds
+    (the median over the steps for the phases of a step, None for disabled phases)
+
+    The model loads its own fuzzy model: a shared one would answer from the results it memoized
+    in the previous cases, the personalities being the same for the same seed.
+    """
+    exit_pos, walls = case_geometry(size, n_exits, obstacles)
+    start = time.perf_counter()
+    model = CrowdModel(n_agents, size, size, walls, exit_pos, random_personality, interactive=False,
+                       seed=seed, **flags, **(model_options or {}))
+    timings = {"construction": time.perf_counter() - start}
+
+    step_timings = []
+    for _ in range(steps):
+        if model.end:
+            break
+        model.step()
+        step_timings.append(model.step_timings)
+
+    for phase in PHASES[1:]:
+        values = [step[phase] for step in step_timings if phase in step]
+        timings[phase] = statistics.median(values) if values else None
+    return timings
+
+
+def run_suite(suite, flags, steps, seed=0, model_options=None):
+    """
+    Run every case of a suite with every flag combination, return the timings by case name
+
+    model_options are other options of CrowdModel used by every case (e.g. {"density_mode": "field"})
+    """
+    if any(combination["use_fuzzy"] for combination in flags):
+        # Import scikit-fuzzy and fill the cache of the fuzzy system (and of its lookup table) before timing anything
+        from fuzzy import FuzzyModel
+        options = model_options or {}
+        FuzzyModel.cached(use_lookup_table=options.get("fuzzy_mode") == "lookup",
+                          lut_resolution=options.get("lut_resolution", 11))
+
+    results = {}
+    for case in SUITES[suite]:
+        for combination in flags:
+            key = case_key(*case, combination)
+            results[key] = run_case(*case, combination, steps, seed, model_options)
+            print(key, " ".join(f"{phase}={value:.4f}s" for phase, value in results[key].items() if value is not None))
+    return results
+
+
+def compare(results, baseline, threshold, min_delta):
+    """
+    Return the regressions: phases slower than in the baseline by more than threshold (relative)
+    and min_delta seconds, as (case, phase, baseline time, time)
+    """
+    regressions = []
+    for key, timings in results.items():
+        for phase, value in timings.items():
+            reference = baseline.get(key, {}).get(phase)
+            if value is None or reference is None:
+                continue
+            if value > reference * (1 + threshold) and value - reference > min_delta:
+                regressions.append((key, phase, reference, value))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CrowdModel and check for performance regressions")
+    parser.add_argument("--suite", choices=SUITES, default="quick")
+    parser.add_argument("--flags", choices=["all", "default"], default="all",
+                        help="every combination of the feature flags, or only every feature on")
+    parser.add_argument("--steps", type=int, default=5, help="number of timed steps per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model-options", type=json.loads, default={},
+                        help='other options of CrowdModel as JSON, e.g. \'{"density_mode": "field"}\'')
+    parser.add_argument("--output", default=None, help="JSON file where the results are written")
+    parser.add_argument("--baseline", default=None, help="JSON results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown counted as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.001,
+                        help="absolute slowdown in seconds under which a phase is never counted as a regression")
+    args = parser.parse_args()
+
+    results = run_suite(args.suite, flag_combinations(args.flags), args.steps, args.seed, args.model_options)
+
+    if args.output is not None:
+        report = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(),
+                "suite": args.suite,
+                "steps": args.steps,
+                "seed": args.seed,
+                "model_options": args.model_options,
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+            },
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        for key, phase, reference, value in regressions:
+            print(f"REGRESSION {key} {phase}: {reference:.4f}s -> {value:.4f}s (+{(value / reference - 1) * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.threshold:.0%} of the baseline")
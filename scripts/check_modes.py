@@ -0,0 +1,149 @@
+"""
+Fixed-seed comparison of the fast paths of CrowdModel with the reference implementations they replace:
+relationship_mode, clustering_mode and contagion_mode "vectorized" against "loop", density_mode "field"
+against "scan", and the batch fuzzy inference (FuzzyModel.compute_parameters_batch, used to build the model)
+against the fuzzy engine (compute_parameters_exact).
+
+Each fast path is switched on alone, then all together, on the same scenario as the reference run, and the
+state of the models is compared after every step: relationships, clusters, neigh, p, pd, pv, positions,
+needed_steps_per_agents and the maximal density. Values are compared for equality, bit for bit.
+
+Usage:
+    python check_modes.py [--agents 200] [--size 50] [--exits 4] [--obstacles] [--steps 30] [--seed 0]
+
+The exit code is 1 when a fast path differs from its reference.
+"""
+import argparse
+import itertools
+import sys
+
+import numpy as np
+
+from agent_store import TRAITS
+from benchmark import case_geometry
+from fuzzy import DEFAULT_PARAMETERS
+from model import CrowdModel
+from scenario import random_personality
+
+REFERENCE_MODES = {"relationship_mode": "loop", "clustering_mode": "loop", "contagion_mode": "loop", "density_mode": "scan"}
+FAST_MODES = {"relationship_mode": "vectorized", "clustering_mode": "vectorized", "contagion_mode": "vectorized",
+              "density_mode": "field"}
+
+
+def snapshot(model):
+    """
+    State of a model compared between the modes (key: name of the compared value)
+    """
+    store = model.agent_store
+    relationships = model.relationships
+    return {
+        "relationships": (relationships.indptr.copy(), relationships.indices.copy(), relationships.distances.copy()),
+        "clusters": {key: [agent.unique_id for agent in members] for key, members in model.clusters.items()},
+        "neigh": store.neigh[:store.size].copy(),
+        "p": store.p[:store.size].copy(),
+        "pd": store.pd[:store.size].copy(),
+        "pv": store.pv[:store.size].copy(),
+        "positions": store.pos[:store.size].copy(),
+        "needed_steps_per_agents": dict(model.needed_steps_per_agents),
+        "max_density": model.max_density_per_episode,
+    }
+
+
+def equal(value1, value2):
+    """Equality of two compared values, tuples of arrays included"""
+    if isinstance(value1, tuple):
+        return all(equal(part1, part2) for part1, part2 in zip(value1, value2))
+    if isinstance(value1, np.ndarray):
+        return np.array_equal(value1, value2)
+    return value1 == value2
+
+
+def run_snapshots(options, n_agents, size, n_exits, obstacles, steps, seed):
+    """
+    Run a model with the given modes and return its snapshot after each step
+    """
+    exit_pos, walls = case_geometry(size, n_exits, obstacles)
+    model = CrowdModel(n_agents, size, size, walls, exit_pos, random_personality, interactive=False, seed=seed,
+                       **options)
+    snapshots = []
+    for _ in range(steps):
+        if model.end:
+            break
+        model.step()
+        snapshots.append(snapshot(model))
+    return model, snapshots
+
+
+def compare_modes(n_agents, size, n_exits, obstacles, steps, seed):
+    """
+    Compare each fast path (alone, then all of them) with the reference run
+
+    output :
+    - differences : dict, key: name of the fast paths, value: list of (step, name of the value) for the
+      first step where each value differs (empty if the run is the same as the reference)
+    - reference : CrowdModel, the model of the reference run
+    """
+    reference, expected = run_snapshots(REFERENCE_MODES, n_agents, size, n_exits, obstacles, steps, seed)
+    candidates = {name: dict(REFERENCE_MODES, **{name: value}) for name, value in FAST_MODES.items()}
+    candidates["all"] = dict(FAST_MODES)
+
+    differences = {}
+    for name, options in candidates.items():
+        _, snapshots = run_snapshots(options, n_agents, size, n_exits, obstacles, steps, seed)
+        differing = {}
+        if len(snapshots) != len(expected):
+            differing["number of steps"] = min(len(snapshots), len(expected))
+        for step, (state, expected_state) in enumerate(zip(snapshots, expected), 1):
+            for key in expected_state:
+                if key not in differing and not equal(state[key], expected_state[key]):
+                    differing[key] = step
+        differences[name] = sorted((step, key) for key, step in differing.items())
+    return differences, reference
+
+
+def compare_fuzzy(fuzzy_model, traits):
+    """
+    Compare the batch fuzzy inference with the fuzzy engine on personalities of shape (N, 5),
+    and return the indices of the personalities where they differ
+    """
+    batch = np.stack(fuzzy_model.compute_parameters_batch(traits), axis=1)
+    exact = np.empty_like(batch)
+    for i, personality in enumerate(np.clip(traits, 0, 1)):
+        try:
+            exact[i] = fuzzy_model.compute_parameters_exact(*personality)
+        except RuntimeError:
+            exact[i] = DEFAULT_PARAMETERS # as PedestrianAgent.fuzzy_preferences_vel_dist
+    return np.flatnonzero((batch != exact).any(axis=1))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the fast paths of CrowdModel with the reference implementations")
+    parser.add_argument("--agents", type=int, default=200)
+    parser.add_argument("--size", type=int, default=50)
+    parser.add_argument("--exits", type=int, default=4)
+    parser.add_argument("--obstacles", action="store_true", help="add a wall in the middle of the grid")
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    differences, reference = compare_modes(args.agents, args.size, args.exits, args.obstacles, args.steps, args.seed)
+    failed = False
+    for name, differing in differences.items():
+        if differing:
+            failed = True
+            print(f"{name}: DIFFERS " + ", ".join(f"{key} from step {step}" for step, key in differing))
+        else:
+            print(f"{name}: same as the reference")
+
+    # Personalities of the agents, and the corners and middles of the personality space
+    traits = np.concatenate((reference.agent_store.traits[:reference.agent_store.size],
+                             np.array(list(itertools.product((0, 0.5, 1), repeat=len(TRAITS))), dtype=float)))
+    mismatches = compare_fuzzy(reference.fuzzy_model, traits)
+    if len(mismatches):
+        failed = True
+        print(f"fuzzy batch: DIFFERS on {len(mismatches)} of {len(traits)} personalities")
+    else:
+        print(f"fuzzy batch: same as the fuzzy engine on {len(traits)} personalities")
+
+    if failed:
+        sys.exit(1)
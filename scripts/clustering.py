@@ -0,0 +1,99 @@
+import numpy as np
+
+
+class Clusters:
+    """
+    Clusters of agents as arrays: the c-th cluster has the center keys[c] (a unique id) and the members
+    members[offsets[c]:offsets[c+1]] (slots in the AgentStore). Clusters are ordered by the density rank of their
+    center, and the members of a cluster by density rank, as the lists of coll_clustering_algo_loop.
+    The label of each agent, the unique id of the center of its cluster, is the neigh column of the AgentStore.
+    """
+
+    def __init__(self, keys, offsets, members):
+        self.keys = keys
+        self.offsets = offsets
+        self.members = members
+
+
+    @classmethod
+    def from_dict(cls, clusters):
+        """
+        Clusters given as a dict (key: unique id of the center, value: list of agents)
+        """
+        keys = np.fromiter(clusters.keys(), dtype=np.int64, count=len(clusters))
+        sizes = np.fromiter((len(members) for members in clusters.values()), dtype=np.int64, count=len(clusters))
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+        members = np.fromiter((agent.slot for members in clusters.values() for agent in members), dtype=np.int64,
+                              count=int(offsets[-1]))
+        return cls(keys, offsets, members)
+
+
+    def to_dict(self, agents):
+        """
+        Return the clusters as a dict (key: unique id of the center, value: list of agents),
+        agents being the agent of each slot
+        """
+        members = [agents[slot] for slot in self.members.tolist()]
+        offsets = self.offsets.tolist()
+        return {key: members[offsets[c]:offsets[c + 1]] for c, key in enumerate(self.keys.tolist())}
+
+
+    def sizes(self):
+        """Return the number of members of each cluster"""
+        return np.diff(self.offsets)
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def collective_clustering(store, relationships, slots):
+    """
+    Algorithm 1: Collective Clustering Algorithm, on arrays
+
+    The agents are ranked by decreasing density (ties in the given order). An agent joins the cluster of its
+    closest related agent when that one is denser, so already ranked; otherwise it is the center of its own cluster.
+    The parent links (closest agent or the agent itself) form a forest whose roots are the centers:
+    the labels are found by pointer jumping.
+
+    input :
+    - store : AgentStore, the state of the agents
+    - relationships : RelationshipStore, the relations of the agents (cf. CrowdModel.update_relationships)
+    - slots : array of int, the slots of the agents to cluster, in the order of the scheduler
+
+    output :
+    - clusters : Clusters, the clusters of the agents, whose labels are also written in the neigh column of the store
+    """
+    n = len(slots)
+    if n == 0:
+        return Clusters(np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64))
+    ids = store.unique_id[slots]
+    p = store.p[slots]
+
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.argsort(-p, kind='stable')] = np.arange(n)
+
+    # Index (in slots) of the closest related agent of each agent, -1 if it has none
+    index_of_id = np.full(relationships.n_agents, -1, dtype=np.int64)
+    index_of_id[ids] = np.arange(n)
+    nearest = relationships.nearest_all()[ids]
+    nearest = np.where(nearest >= 0, index_of_id[nearest], -1)
+
+    parent = np.arange(n)
+    joins = nearest >= 0
+    joins[joins] = p[nearest[joins]] > p[joins]
+    parent[joins] = nearest[joins]
+
+    # The parent of an agent is strictly denser, so the links have no cycle: jump until every agent points to its root
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            break
+        parent = grandparent
+
+    store.neigh[slots] = ids[parent]
+
+    order = np.lexsort((rank, rank[parent]))
+    roots = parent[order]
+    starts = np.flatnonzero(np.r_[True, roots[1:] != roots[:-1]])
+    return Clusters(ids[roots[starts]], np.append(starts, n), slots[order])
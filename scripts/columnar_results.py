@@ -0,0 +1,86 @@
+"""
+Columnar binary format of the results of a simulation, an alternative to the JSON of CrowdModel.dump_metrics
+that is fast to write and to load for large crowds.
+
+A run is a directory holding:
+- meta.json : the simulation name, timestamp, configuration, total number of steps and completion
+- one .npy file per column of the per-agent table (row i is the agent of unique id agent_id[i]):
+  agent_id (int64), agent_traits (float64, N x 5, columns O C E A N), agent_initial_pd, agent_initial_pv (float64),
+  agent_exit_step (int64, step at which the agent got out, -1 if it did not)
+- one .npy file per per-step series: step_max_density (float64), step_evacuated (int64, agents out at each step)
+
+The .npy files can be memory-mapped, so that loading a run reads nothing but meta.json until the columns are used.
+"""
+import json
+import os
+
+import numpy as np
+
+TRAITS = ['O', 'C', 'E', 'A', 'N']
+AGENT_COLUMNS = ["agent_id", "agent_traits", "agent_initial_pd", "agent_initial_pv", "agent_exit_step"]
+STEP_COLUMNS = ["step_max_density", "step_evacuated"]
+
+
+def write_run(model, path, simulation_name, completed=None):
+    """
+    Write the results of a CrowdModel in the directory path (created if needed)
+
+    input :
+    - model : CrowdModel, the simulation
+    - path : str, the directory of the run
+    - simulation_name : str, the name of the simulation
+    - completed : bool, whether the simulation got to its end, model.end if None
+    """
+    os.makedirs(path, exist_ok=True)
+    metrics = model.get_metrics(simulation_name)
+    meta = {
+        "simulation_name": metrics["simulation_name"],
+        "timestamp": metrics["timestamp"],
+        "configuration": metrics["configuration"],
+        "total_steps": model.nb_steps,
+        "completed": model.end if completed is None else completed,
+    }
+    with open(os.path.join(path, "meta.json"), 'w') as f:
+        json.dump(meta, f, indent=4)
+
+    ids = np.array(sorted(model.agent_personalities), dtype=np.int64)
+    traits = np.array([[model.agent_personalities[i][trait] for trait in TRAITS] for i in ids.tolist()], dtype=float)
+    initial_preferences = np.array([model.agent_initial_preferences[i] for i in ids.tolist()], dtype=float).reshape(-1, 2)
+    exit_steps = np.array([model.needed_steps_per_agents.get(i, -1) for i in ids.tolist()], dtype=np.int64)
+
+    columns = {
+        "agent_id": ids,
+        "agent_traits": traits.reshape(-1, len(TRAITS)),
+        "agent_initial_pd": initial_preferences[:, 0],
+        "agent_initial_pv": initial_preferences[:, 1],
+        "agent_exit_step": exit_steps,
+        "step_max_density": np.array(model.max_density_across_episodes, dtype=float),
+        "step_evacuated": np.bincount(exit_steps[exit_steps >= 0], minlength=model.nb_steps).astype(np.int64),
+    }
+    for name, column in columns.items():
+        np.save(os.path.join(path, f"{name}.npy"), column)
+    return path
+
+
+def is_run(path):
+    """Return True if path is a run directory in the columnar format"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "meta.json"))
+
+
+def load_run(path, mmap_mode='r'):
+    """
+    Load a run directory
+
+    input :
+    - path : str, the directory of the run
+    - mmap_mode : str, memory-map mode of the columns (cf. numpy.load), None to read them in memory
+
+    output :
+    - meta : dict, the content of meta.json
+    - columns : dict, the array of each column by name
+    """
+    with open(os.path.join(path, "meta.json"), 'r') as f:
+        meta = json.load(f)
+    columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+               for name in AGENT_COLUMNS + STEP_COLUMNS}
+    return meta, columns
@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+
+
+def emotion_contagion(model, chunk_size=1 << 20):
+    """
+    Algorithm 2, p7 : Emotion Contagion Algorithm, for all the agents of the scheduler at once
+    (cf. PedestrianAgent.update_emotions, the per-agent reference)
+
+    The agents are updated one after the other in the order of the scheduler, each one seeing the
+    preferences already updated. Agents only read the preferences of their cluster, so the clusters are
+    independent: round r updates the r-th agent of every cluster at the same time, its contagion terms
+    exp((pd_j - pd_i) / dist) being computed as arrays over the members of its cluster, by chunks of at most
+    chunk_size terms, and summed in the order of the cluster list as update_emotions does.
+    The exponentials are those of math.exp, as in update_emotions (np.exp differs in the last bit for a few
+    percent of the arguments), so that the preferences are the same as with the per-agent update, bit for bit.
+    """
+    store = model.agent_store
+    slots = model.scheduled_slots() # in the order of the scheduler
+    if len(slots) == 0:
+        return
+
+    clusters = model.cluster_arrays
+    keys, indptr, members = clusters.keys, clusters.offsets, clusters.members
+    sorter = np.argsort(keys)
+    cluster = sorter[np.searchsorted(keys, store.neigh[slots], sorter=sorter)]
+    sizes = (indptr[1:] - indptr[:-1])[cluster]
+
+    # Rank of each agent among the agents of its cluster, in the order of the scheduler
+    order = np.argsort(cluster, kind='stable')
+    starts = np.flatnonzero(np.r_[True, cluster[order][1:] != cluster[order][:-1]])
+    rank = np.empty(len(slots), dtype=np.int64)
+    rank[order] = np.arange(len(slots)) - np.repeat(starts, np.diff(np.r_[starts, len(slots)]))
+
+    # Selective perception and dampening, which do not depend on the other agents
+    pos = store.pos[slots]
+    omega_d = _exp(-0.05 * model.exit_distance[pos[:, 0], pos[:, 1]].astype(float))
+    omega_v = _exp(-2.0 * store.vel0[slots])
+    zeta_d = store.initial_pd[slots] * 0.1
+    zeta_v = store.initial_pv[slots] * 0.1
+
+    for r in range(int(rank.max()) + 1):
+        # Agents of the round, by increasing cluster size so that the chunks are padded as little as possible
+        rows = np.flatnonzero(rank == r)
+        rows = rows[np.argsort(sizes[rows], kind='stable')]
+        start = 0
+        while start < len(rows):
+            stop = start + 1
+            while stop < len(rows) and (stop - start + 1) * sizes[rows[stop]] <= chunk_size:
+                stop += 1
+            chunk = rows[start:stop]
+            start = stop
+
+            delta_pd, delta_pv = _contagion_terms(store, slots[chunk], cluster[chunk], indptr, members,
+                                                  int(sizes[chunk[-1]]))
+            i = slots[chunk]
+            pd = store.pd[i] + (delta_pd * omega_d[chunk] + zeta_d[chunk])
+            pv = store.pv[i] + (delta_pv * omega_v[chunk] + zeta_v[chunk])
+            total = pd + pv
+            store.pd[i] = pd / total
+            store.pv[i] = pv / total
+
+
+def _contagion_terms(store, slots, cluster, indptr, members, width):
+    """
+    Sums of exp((pd_j - pd_i) / dist) and exp((pv_j - pv_i) / dist) over the other members j of the cluster
+    of each agent i, added in the order of the cluster list
+    """
+    column = np.arange(width)
+    size = indptr[cluster + 1] - indptr[cluster]
+    inside = column[None, :] < size[:, None]
+    neighbors = members[np.where(inside, indptr[cluster, None] + column[None, :], 0)]
+    others = inside & (neighbors != slots[:, None])
+
+    dxy = store.pos[neighbors] - store.pos[slots, None]
+    dist = np.sqrt(dxy[..., 0]**2 + dxy[..., 1]**2)
+    terms_pd = np.zeros(others.shape)
+    terms_pv = np.zeros(others.shape)
+    rows, columns = np.nonzero(others)
+    neighbors, slots, dist = neighbors[rows, columns], slots[rows], dist[rows, columns]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms_pd[rows, columns] = _exp((store.pd[neighbors] - store.pd[slots]) / dist)
+        terms_pv[rows, columns] = _exp((store.pv[neighbors] - store.pv[slots]) / dist)
+
+    # Accumulated from left to right (unlike sum, which adds by pairs), as the loop of update_emotions
+    return np.add.accumulate(terms_pd, axis=1)[:, -1], np.add.accumulate(terms_pv, axis=1)[:, -1]
+
+
+def _exp(x):
+    """Exponential of each value of a 1-D array with math.exp, the one of update_emotions"""
+    return np.fromiter(map(math.exp, x.tolist()), dtype=float, count=len(x))
@@ -0,0 +1,96 @@
+import numpy as np
+from math import sqrt, exp
+
+
+class DensityField:
+    """
+    Pedestrian density of every cell of the grid, as returned by PedestrianAgent.get_density.
+
+    Pedestrians contribute exp(-d²) to the density of the cells of their (2*ra+1)² neighborhood, d taking
+    only a few distinct values. For each cell the field keeps, per distinct distance, the number of
+    pedestrians at that distance: these integer counts are exactly maintained by stamping a pedestrian
+    out of its old neighborhood and into the new one whenever it moves, so the field always reflects
+    the moves already done during the step (as the sequential activation requires), never drifts,
+    and the density of a cell is a lookup of its counts.
+    """
+
+    def __init__(self, width, height, alpha=0.75, ra=4):
+        self.width = width
+        self.height = height
+        self.alpha = alpha
+        self.ra = ra
+
+        # Offsets of the neighborhood (center excluded) and the distance class of each of them
+        dx, dy = np.meshgrid(np.arange(-ra, ra + 1), np.arange(-ra, ra + 1), indexing='ij')
+        not_center = (dx != 0) | (dy != 0)
+        self.dx, self.dy = dx[not_center], dy[not_center]
+        squared_dists, self.classes = np.unique(self.dx**2 + self.dy**2, return_inverse=True)
+
+        # Contribution of one pedestrian for each distance class, computed as in get_density
+        self.weights = np.array([exp(-sqrt(d2)**2) for d2 in squared_dists.tolist()])
+
+        self.counts = np.zeros((width, height, len(self.weights)), dtype=np.int32)
+
+        # Number of cells of the neighborhood inside the grid
+        self.nb_neighbors = np.zeros((width, height), dtype=np.int32)
+        for dx, dy in zip(self.dx, self.dy):
+            self.nb_neighbors[self._window(dx, dy)] += 1
+
+
+    def _window(self, dx, dy):
+        """Slices of the cells (x, y) of the grid such that (x+dx, y+dy) is also on the grid"""
+        return (slice(max(0, -dx), self.width - max(0, dx)), slice(max(0, -dy), self.height - max(0, dy)))
+
+
+    def rebuild(self, positions):
+        """
+        Recompute the field from the positions of all the pedestrians on the grid
+        """
+        occupancy = np.zeros((self.width, self.height), dtype=np.int32)
+        if len(positions) > 0:
+            xs, ys = np.asarray(positions, dtype=int).T
+            np.add.at(occupancy, (xs, ys), 1)
+
+        self.counts[:] = 0
+        for dx, dy, cls in zip(self.dx, self.dy, self.classes):
+            # A pedestrian at (x+dx, y+dy) is in the neighborhood of the cell (x, y)
+            self.counts[self._window(dx, dy) + (cls,)] += occupancy[self._window(-dx, -dy)]
+
+
+    def stamp(self, pos, sign):
+        """
+        Add (sign=1) or remove (sign=-1) the contribution of a pedestrian at pos to the cells around it
+        """
+        xs, ys = pos[0] + self.dx, pos[1] + self.dy
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        # Offsets are distinct, so are the updated cells
+        self.counts[xs[inside], ys[inside], self.classes[inside]] += sign
+
+
+    def move(self, old_pos, new_pos):
+        """
+        Update the field when a pedestrian moves from old_pos to new_pos
+        """
+        if old_pos != new_pos:
+            self.stamp(old_pos, -1)
+            self.stamp(new_pos, 1)
+
+
+    def densities(self, xs, ys):
+        """
+        Return the density scores and the real densities of the cells (xs[i], ys[i]) as arrays
+        """
+        counts = self.counts[xs, ys]
+        density_scores = (counts @ self.weights) * self.alpha
+
+        real_densities = counts.sum(axis=-1) / self.nb_neighbors[xs, ys]
+        real_densities = real_densities / 0.35**2
+        return density_scores, real_densities
+
+
+    def density(self, cell):
+        """
+        Return the density score and the real density of the given cell (cf. PedestrianAgent.get_density)
+        """
+        density_scores, real_densities = self.densities([cell[0]], [cell[1]])
+        return float(density_scores[0]), float(real_densities[0])
@@ -1,18 +1,91 @@
+import hashlib
+import itertools
+import logging
+import os
+import pickle
 import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
+from skfuzzy.control.term import TermAggregate
 from typing import Tuple
 
+# Directory where the lookup tables are persisted
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache')
+
+logger = logging.getLogger(__name__)
+
+# Pd and Pv used by the agents when the fuzzy engine fails (cf. PedestrianAgent.fuzzy_preferences_vel_dist)
+DEFAULT_PARAMETERS = (1.5, 1.5)
+
 class FuzzyModel:
     """
     Enhanced fuzzy logic model for personality-based distance calculation
     with binary (high/low) output membership functions
     """
-    def __init__(self):
+    def __init__(self, use_lookup_table: bool = False, lut_resolution: int = 11, cache_dir: str = DEFAULT_CACHE_DIR):
+        """
+        Args:
+            use_lookup_table (bool): interpolate Pd and Pv in a precomputed table instead of running the fuzzy engine
+            lut_resolution (int): number of lattice points per personality trait of the lookup table (11 puts
+                the breakpoints of the input membership functions on the lattice). At 11, the interpolation error
+                on random personalities is 0.035 on average and below 0.3 for 99% of them, but reaches about 0.7
+                near the personalities where no rule fires, the engine then falling back to DEFAULT_PARAMETERS:
+                a step that no resolution removes (still 0.7 at 16, for a build 7 times longer), hence the exact
+                engine by default
+            cache_dir (str): directory where the lookup tables are persisted (None to disable persistence)
+        """
         self.simulation = None
-        print("Initializing FuzzyModel...")
+        self.lookup_table = None
+        logger.info("Initializing FuzzyModel...")
         self.define_fuzzy_model()
 
+        if use_lookup_table:
+            self.lookup_table = FuzzyLookupTable.load_or_build(self, lut_resolution, cache_dir)
+
+    @classmethod
+    def cached(cls, use_lookup_table: bool = False, lut_resolution: int = 11, cache_dir: str = DEFAULT_CACHE_DIR) -> "FuzzyModel":
+        """
+        Return a FuzzyModel, unpickled from the cache directory instead of rebuilding the control system
+        when this version of the fuzzy system was already built (same arguments as the constructor).
+        A cached file that cannot be loaded is rebuilt.
+        """
+        if cache_dir is None:
+            return cls(use_lookup_table, lut_resolution, cache_dir)
+
+        path = os.path.join(cache_dir, f"fuzzy_system_{cls.source_hash()[:16]}.pkl")
+        fuzzy_model = None
+        try:
+            with open(path, 'rb') as file:
+                fuzzy_model = pickle.load(file)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            # Any unreadable pickle (truncated, written by other versions of the libraries...) is rebuilt
+            logger.warning(f"Cannot load the cached fuzzy system {path} ({e!r}), rebuilding it")
+
+        if fuzzy_model is None:
+            fuzzy_model = cls()
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write then rename, so that concurrent processes never read a partial file
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, 'wb') as file:
+                pickle.dump(fuzzy_model, file)
+            os.replace(temporary_path, path)
+
+        if use_lookup_table:
+            fuzzy_model.lookup_table = FuzzyLookupTable.load_or_build(fuzzy_model, lut_resolution, cache_dir)
+        return fuzzy_model
+
+    @staticmethod
+    def source_hash() -> str:
+        """
+        Hash of this module and of the scikit-fuzzy version, identifying the fuzzy system it builds
+        """
+        digest = hashlib.sha256(fuzz.__version__.encode())
+        with open(os.path.abspath(__file__), 'rb') as file:
+            digest.update(file.read())
+        return digest.hexdigest()
+
     def define_fuzzy_model(self) -> None:
         try:
             # Define universes for each variable with fine granularity
@@ -112,14 +185,31 @@ class FuzzyModel:
             ]
 
             # Create and initialize control system
+            self.rules = rules
+            self.variables = [openness, conscientiousness, extraversion, agreeableness, neuroticism, P_d, P_v]
             control_system = ctrl.ControlSystem(rules)
             self.simulation = ctrl.ControlSystemSimulation(control_system)
-            print("Fuzzy model initialization complete")
+            logger.info("Fuzzy model initialization complete")
 
         except Exception as e:
-            print(f"Error during initialization: {str(e)}")
+            logger.error(f"Error during initialization: {str(e)}")
             raise
 
+    def rule_set_hash(self) -> str:
+        """
+        Hash of the rules and of the membership functions, identifying the fuzzy system
+        """
+        digest = hashlib.sha256()
+        for rule in self.rules:
+            digest.update(repr(rule).encode())
+        for variable in self.variables:
+            digest.update(variable.label.encode())
+            digest.update(np.ascontiguousarray(variable.universe, dtype=float).tobytes())
+            for label, term in variable.terms.items():
+                digest.update(label.encode())
+                digest.update(np.ascontiguousarray(term.mf, dtype=float).tobytes())
+        return digest.hexdigest()
+
     def compute_parameters(self, o: float, c: float, e: float, a: float, n: float) -> Tuple[float, float]:
         """
         Compute both distance and value metrics based on all personality factors
@@ -134,6 +224,15 @@ class FuzzyModel:
         Returns:
             Tuple[float, float]: (distance metric, value metric)
         """
+        if self.lookup_table is not None:
+            p_d, p_v = self.lookup_table.interpolate(np.array([[o, c, e, a, n]]))
+            return float(p_d[0]), float(p_v[0])
+        return self.compute_parameters_exact(o, c, e, a, n)
+
+    def compute_parameters_exact(self, o: float, c: float, e: float, a: float, n: float) -> Tuple[float, float]:
+        """
+        Compute both metrics with the fuzzy engine (cf. compute_parameters)
+        """
         try:
             # Ensure inputs are within bounds and correct if not
             inputs = {
@@ -163,10 +262,220 @@ class FuzzyModel:
             return p_d, p_v
 
         except Exception as e:
-            print(f"Error in compute_personality_metrics: {str(e)}")
+            logger.debug(f"Error in compute_personality_metrics: {str(e)}")
             raise RuntimeError(f"Error computing metrics: {str(e)}")
 
+    def compute_parameters_array(self, traits: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compute both metrics for an array of personalities of shape (N, 5), as compute_parameters does
+        for one: interpolated in the lookup table if any, exactly otherwise (cf. compute_parameters_batch)
+        """
+        if self.lookup_table is not None:
+            return self.lookup_table.interpolate(traits)
+        return self.compute_parameters_batch(traits)
+
+    def compute_parameters_batch(self, traits: np.ndarray, chunk_size: int = 4096) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compute both metrics for an array of personalities with array operations, reproducing the
+        Mamdani inference of the fuzzy engine (fuzzification, rule activation, accumulation by maximum
+        and centroid defuzzification, cf. compute_parameters_exact).
+
+        The fuzzy system is only read, so unlike the other compute methods (which go through the shared
+        simulation) this one can be called from several threads at once.
+
+        Args:
+            traits (np.ndarray): personalities of shape (N, 5), columns being O, C, E, A, N
+            chunk_size (int): number of personalities processed at once, to bound the memory used
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (distance metrics, value metrics), personalities for which the
+            engine fails (no rule fires for an output) get DEFAULT_PARAMETERS as the agents do
+        """
+        traits = np.clip(np.atleast_2d(np.asarray(traits, dtype=float)), 0, 1)
+        p_d = np.empty(len(traits))
+        p_v = np.empty(len(traits))
+        for start in range(0, len(traits), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            p_d[chunk], p_v[chunk] = self._compute_chunk(traits[chunk])
+        return p_d, p_v
+
+    def _compute_chunk(self, traits: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        antecedents, consequents = self.variables[:5], self.variables[5:]
+
+        # Fuzzification of the inputs
+        memberships = {}
+        for column, variable in enumerate(antecedents):
+            for label, term in variable.terms.items():
+                memberships[variable.label, label] = np.interp(traits[:, column], variable.universe, term.mf)
+
+        # Activation of the rules, accumulated for each term of the outputs
+        cuts = {}
+        for rule in self.rules:
+            firing = self._firing(rule.antecedent, rule, memberships)
+            for weighted_term in rule.consequent:
+                term = weighted_term.term
+                key = term.parent.label, term.label
+                activation = firing * weighted_term.weight
+                cuts[key] = activation if key not in cuts else term.parent.accumulation_method(activation, cuts[key])
+
+        outputs = [self._centroid(variable, cuts, len(traits)) for variable in consequents]
+        failed = np.isnan(outputs[0]) | np.isnan(outputs[1])
+        outputs[0][failed], outputs[1][failed] = DEFAULT_PARAMETERS
+        return outputs[0], outputs[1]
+
+    @staticmethod
+    def _firing(antecedent, rule, memberships: dict) -> np.ndarray:
+        """
+        Firing strength of (a part of) the antecedent of a rule
+        """
+        if not isinstance(antecedent, TermAggregate):
+            return memberships[antecedent.parent.label, antecedent.label]
+        first = FuzzyModel._firing(antecedent.term1, rule, memberships)
+        if antecedent.kind == 'not':
+            return 1. - first
+        second = FuzzyModel._firing(antecedent.term2, rule, memberships)
+        if antecedent.kind == 'and':
+            return rule.and_func(first, second)
+        return rule.or_func(first, second)
+
+    @staticmethod
+    def _centroid(variable, cuts: dict, n: int) -> np.ndarray:
+        """
+        Centroid of the union of the terms of an output cut at their activation, nan when it is empty.
+
+        As in the fuzzy engine, the union is sampled on the universe plus the points where each term
+        crosses its cut, and the area under the samples is computed exactly segment by segment.
+        """
+        universe = variable.universe
+        terms = [(term.mf, cuts[variable.label, label][:, None])
+                 for label, term in variable.terms.items() if (variable.label, label) in cuts]
+        if not terms:
+            return np.full(n, np.nan)
+
+        # Points where the membership of each term crosses its cut (cf. skfuzzy _interp_universe_fast),
+        # the other segments of the universe giving a duplicate of its first point, which adds no area
+        points = [np.broadcast_to(universe, (n, len(universe)))]
+        for mf, cut in terms:
+            crossing = np.diff(np.where(cut == 0., mf > cut, mf >= cut), axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                crossed = universe[:-1] + (cut - mf[:-1]) * (universe[1:] - universe[:-1]) / (mf[1:] - mf[:-1])
+            crossed = np.where(crossing, crossed, universe[0])
+            # Keep only as many columns as the most crossed row needs
+            order = np.argsort(~crossing, axis=1, kind='stable')[:, :crossing.sum(axis=1).max(initial=0)]
+            points.append(np.take_along_axis(crossed, order, axis=1))
+        x = np.sort(np.concatenate(points, axis=1), axis=1)
+
+        mfx = np.zeros_like(x)
+        for mf, cut in terms:
+            np.maximum(mfx, np.minimum(cut, np.interp(x, universe, mf)), mfx)
+
+        # Exact moment and area of each segment, rectangles and triangles being handled as the engine does
+        x1, x2, y1, y2 = x[:, :-1], x[:, 1:], mfx[:, :-1], mfx[:, 1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            moment = np.select(
+                [y1 == y2, y1 == 0.0, y2 == 0.0],
+                [0.5 * (x1 + x2), 2.0 / 3.0 * (x2 - x1) + x1, 1.0 / 3.0 * (x2 - x1) + x1],
+                (2.0 / 3.0 * (x2 - x1) * (y2 + 0.5 * y1)) / (y1 + y2) + x1)
+            area = np.select(
+                [y1 == y2, y1 == 0.0, y2 == 0.0],
+                [(x2 - x1) * y1, 0.5 * (x2 - x1) * y2, 0.5 * (x2 - x1) * y1],
+                0.5 * (x2 - x1) * (y1 + y2))
+        empty_segment = ((y1 == 0.0) & (y2 == 0.0)) | (x1 == x2)
+        moment[empty_segment] = 0.0
+        area[empty_segment] = 0.0
+
+        # Sequential sums, in the order of the engine
+        sum_moment_area = np.add.accumulate(moment * area, axis=1)[:, -1]
+        sum_area = np.add.accumulate(area, axis=1)[:, -1]
+        centroid = sum_moment_area / np.fmax(sum_area, np.finfo(float).eps)
+        centroid[mfx.sum(axis=1) == 0] = np.nan
+        return centroid
+
+
+
+
+class FuzzyLookupTable:
+    """
+    Pd and Pv sampled on a regular lattice of the 5-D personality space (O, C, E, A, N in [0, 1]),
+    and multilinearly interpolated in between. Much faster than running the fuzzy engine for each agent,
+    but only an approximation of it across the steps of its output (cf. FuzzyModel, lut_resolution).
+    """
+
+    def __init__(self, pd: np.ndarray, pv: np.ndarray, rules_hash: str, max_error: Tuple[float, float] = (np.nan, np.nan)):
+        """
+        Args:
+            pd, pv (np.ndarray): tables of shape (resolution,) * 5, the values at the lattice points
+            rules_hash (str): hash of the fuzzy system the table was computed from
+            max_error (Tuple[float, float]): maximum interpolation error measured on Pd and Pv
+        """
+        self.pd = pd
+        self.pv = pv
+        self.resolution = pd.shape[0]
+        self.rules_hash = rules_hash
+        self.max_error = max_error
+
+    @classmethod
+    def build(cls, fuzzy_model: FuzzyModel, resolution: int, n_error_samples: int = 10000, seed: int = 0) -> "FuzzyLookupTable":
+        """
+        Compute the table with the fuzzy engine, then measure the interpolation error on random personalities
+        """
+        logger.info(f"Building the fuzzy lookup table ({resolution}^5 points)...")
+        lattice = np.linspace(0, 1, resolution)
+        points = np.stack(np.meshgrid(*[lattice] * 5, indexing='ij'), axis=-1).reshape(-1, 5)
+        pd, pv = fuzzy_model.compute_parameters_batch(points)
+
+        table = cls(pd.reshape((resolution,) * 5), pv.reshape((resolution,) * 5), fuzzy_model.rule_set_hash())
+
+        samples = np.random.default_rng(seed).random((n_error_samples, 5))
+        exact = np.stack(fuzzy_model.compute_parameters_batch(samples), axis=1)
+        interpolated = np.stack(table.interpolate(samples), axis=1)
+        table.max_error = tuple(np.abs(exact - interpolated).max(axis=0).tolist())
+        logger.info(f"Fuzzy lookup table built, maximum interpolation error: P_d {table.max_error[0]:.4f}, P_v {table.max_error[1]:.4f}")
+        return table
+
+    @classmethod
+    def load_or_build(cls, fuzzy_model: FuzzyModel, resolution: int, cache_dir: str = DEFAULT_CACHE_DIR) -> "FuzzyLookupTable":
+        """
+        Load the table of this fuzzy system from the cache directory, build and save it if there is none
+        """
+        if cache_dir is None:
+            return cls.build(fuzzy_model, resolution)
+
+        path = os.path.join(cache_dir, f"fuzzy_lut_{fuzzy_model.rule_set_hash()[:16]}_{resolution}.npz")
+        if os.path.exists(path):
+            return cls.load(path)
+
+        table = cls.build(fuzzy_model, resolution)
+        table.save(path)
+        return table
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, pd=self.pd, pv=self.pv, rules_hash=self.rules_hash, max_error=np.array(self.max_error))
+
+    @classmethod
+    def load(cls, path: str) -> "FuzzyLookupTable":
+        data = np.load(path)
+        return cls(data['pd'], data['pv'], str(data['rules_hash']), tuple(data['max_error'].tolist()))
+
+    def interpolate(self, traits: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Interpolate Pd and Pv for an array of personalities of shape (N, 5)
+        """
+        position = np.clip(np.asarray(traits, dtype=float), 0, 1) * (self.resolution - 1)
+        lower = np.minimum(np.floor(position).astype(int), self.resolution - 2)
+        fraction = position - lower
 
+        pd = np.zeros(len(position))
+        pv = np.zeros(len(position))
+        # Weighted sum over the 32 corners of the lattice cell containing each personality
+        for corner in itertools.product((0, 1), repeat=5):
+            corner = np.array(corner)
+            weight = np.prod(np.where(corner == 1, fraction, 1 - fraction), axis=1)
+            index = tuple((lower + corner).T)
+            pd += weight * self.pd[index]
+            pv += weight * self.pv[index]
+        return pd, pv
 
 
 def test_model():
@@ -199,7 +508,7 @@ def test_model():
         }
         
         try:
-            p_d, p_v = model.compute_personality_metrics(
+            p_d, p_v = model.compute_parameters(
                 personality_scores['O'],
                 personality_scores['C'],
                 personality_scores['E'],
@@ -239,7 +548,7 @@ def test_model():
         
         for inputs in test_extremes:
             try:
-                p_d, p_v = model.compute_personality_metrics(*inputs)
+                p_d, p_v = model.compute_parameters(*inputs)
                 print(f"\nInputs: {inputs}")
                 print(f"P_d={p_d:.2f}, P_v={p_v:.2f}")
                 
@@ -1,3 +1,4 @@
+import numpy as np
 from mesa.space import MultiGrid
 
 class MultiGridWithProperties(MultiGrid):
@@ -5,6 +6,38 @@ class MultiGridWithProperties(MultiGrid):
         super().__init__(width, height, torus)
         self.cell_properties = {(x, y): {} for x in range(width) for y in range(height)}
 
+        # Number of agents of each kind in every cell, kept in sync with the content of the grid
+        # so that the agents can look at the grid with array reads instead of going through the cell contents.
+        # The kind of an agent is given by its class attribute "layer" (pedestrian, exit or obstacle),
+        # and every agent but the exits blocks the cell
+        self.pedestrian_layer = np.zeros((width, height), dtype=np.uint8)
+        self.exit_layer = np.zeros((width, height), dtype=np.uint8)
+        self.obstacle_layer = np.zeros((width, height), dtype=np.uint8)
+        self.blocked_layer = np.zeros((width, height), dtype=np.uint8)
+        self.layers = {"pedestrian": self.pedestrian_layer, "exit": self.exit_layer, "obstacle": self.obstacle_layer}
+
+    def place_agent(self, agent, pos):
+        # The grid ignores agents already placed in this cell
+        placed = agent.pos is None or agent not in self._grid[pos[0]][pos[1]]
+        super().place_agent(agent, pos)
+        if placed:
+            layer = getattr(agent, "layer", None)
+            if layer is not None:
+                self.layers[layer][pos] += 1
+            if layer != "exit":
+                self.blocked_layer[pos] += 1
+
+    def remove_agent(self, agent):
+        pos = agent.pos
+        super().remove_agent(agent)
+        layer = getattr(agent, "layer", None)
+        if layer is not None:
+            self.layers[layer][pos] -= 1
+        if layer != "exit":
+            self.blocked_layer[pos] -= 1
+
+    # move_agent is a remove_agent followed by a place_agent, which keep the layers up to date
+
     def set_cell_property(self, pos, property_name, value):
         self.cell_properties[pos][property_name] = value
 
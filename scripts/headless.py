@@ -0,0 +1,99 @@
+"""
+Headless runner: runs a scenario (cf. scenario.py) to completion or to a step cap, without browser,
+prompt, print or exit of the process, and returns the metrics of the simulation (cf. CrowdModel.get_metrics).
+
+Usage:
+    python headless.py scenario.json [--max-steps 500] [--output results/metrics.json]
+"""
+import argparse
+import json
+import sys
+
+from metrics_stream import MetricsStream
+from model import CrowdModel
+from profiler import StepProfiler
+from scenario import PERSONALITY_FUNCTIONS, load_scenario
+
+
+def build_model(scenario, fuzzy_model=None, metrics_stream=None, profiler=None):
+    """
+    Create the CrowdModel of a scenario (as returned by scenario.load_scenario),
+    using the given FuzzyModel if any instead of loading one, streaming its metrics to metrics_stream if any
+    and instrumenting its steps with profiler if any
+    """
+    return CrowdModel(
+        scenario["n_agents"],
+        scenario["width"],
+        scenario["height"],
+        scenario["obstacles"],
+        scenario["exits"],
+        PERSONALITY_FUNCTIONS[scenario["personality"]],
+        agent_loc=scenario["agent_locations"],
+        interactive=False,
+        seed=scenario["seed"],
+        fuzzy_model=fuzzy_model,
+        metrics_stream=metrics_stream,
+        profiler=profiler,
+        **scenario["features"],
+    )
+
+
+def run_scenario(scenario, max_steps=None, fuzzy_model=None, stream_dir=None, columns_dir=None, profile_path=None):
+    """
+    Run a scenario until every agent is out or max_steps steps are done
+
+    input :
+    - scenario : dict, as returned by scenario.load_scenario
+    - max_steps : int, the step cap, None to use the one of the scenario (and no cap if it has none)
+    - fuzzy_model : FuzzyModel, already loaded, None to let the model load it
+    - stream_dir : str, directory where the metrics of every step are streamed (cf. MetricsStream), None not to stream them
+    - columns_dir : str, directory where the results are also written in the columnar format (cf. columnar_results)
+    - profile_path : str, JSON file where the timings and counters of every step are written (cf. profiler.StepProfiler)
+
+    output :
+    - metrics : dict, the metrics of CrowdModel.get_metrics, whose results also tell if the simulation completed
+    """
+    if max_steps is None:
+        max_steps = scenario["max_steps"]
+
+    stream = MetricsStream(stream_dir, scenario["name"]) if stream_dir is not None else None
+    profiler = StepProfiler() if profile_path is not None else None
+    try:
+        model = build_model(scenario, fuzzy_model, stream, profiler)
+        while not model.end and (max_steps is None or model.nb_steps < max_steps):
+            model.step()
+
+        metrics = model.get_metrics(scenario["name"])
+        metrics["results"]["completed"] = model.end
+        if stream is not None:
+            stream.close(summary=metrics) # does nothing if the model completed, as it already wrote the summary
+    finally:
+        if stream is not None:
+            stream.close() # keeps the records written so far if the run failed
+
+    if stream is not None:
+        metrics["metrics_stream"] = stream.path
+    if profiler is not None:
+        metrics["profile"] = profiler.dump(profile_path)
+    if columns_dir is not None:
+        metrics["columns"] = model.dump_columns(scenario["name"], columns_dir)
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a crowd simulation scenario without visualisation")
+    parser.add_argument("scenario", help="path of the JSON scenario file")
+    parser.add_argument("--max-steps", type=int, default=None, help="step cap, overriding the one of the scenario")
+    parser.add_argument("--output", default=None, help="JSON file where the metrics are written (standard output by default)")
+    parser.add_argument("--stream", default=None, help="directory where the metrics of every step are streamed in JSON Lines")
+    parser.add_argument("--columns", default=None, help="directory where the results are also written in the columnar format")
+    parser.add_argument("--profile", default=None, help="JSON file where the timings and counters of every step are written")
+    args = parser.parse_args()
+
+    metrics = run_scenario(load_scenario(args.scenario), args.max_steps, stream_dir=args.stream, columns_dir=args.columns,
+                           profile_path=args.profile)
+    if args.output is None:
+        json.dump(metrics, sys.stdout, indent=4)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(metrics, f, indent=4)
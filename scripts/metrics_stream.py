@@ -0,0 +1,121 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+
+def unique_filename(directory, prefix, extension):
+    """
+    Return the path of a new file of directory, whose name can not be taken by another run even in parallel
+    (timestamp to the microsecond, process id and random suffix)
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    return os.path.join(directory, f"{prefix}_{timestamp}_{os.getpid()}_{uuid.uuid4().hex[:8]}{extension}")
+
+
+class MetricsStream:
+    """
+    Append-only sink of the metrics of a simulation, in JSON Lines: one record per line, written as the
+    simulation goes so that a run that dies keeps its records up to the last flush.
+
+    Records are serialized and written by a background thread, so that the step loop only puts them in a queue.
+    The file is flushed whenever the queue is empty and at least every flush_interval seconds.
+    """
+
+    def __init__(self, directory="results", name="simulation", flush_interval=1.0):
+        """
+        input :
+        - directory : str, the directory of the file, created if needed
+        - name : str, the name of the simulation, used as prefix of the file name
+        - flush_interval : float, the maximum delay in seconds before a record reaches the file
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.name = name
+        self.path = unique_filename(directory, name, ".jsonl")
+        self.flush_interval = flush_interval
+        self.closed = False
+
+        self._queue = queue.Queue()
+        self._file = open(self.path, 'w', buffering=1 << 16)
+        self._thread = threading.Thread(target=self._write_records, name=f"MetricsStream-{name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+
+    def write(self, record):
+        """
+        Append a record (dict serializable to JSON)
+        """
+        if self.closed:
+            raise ValueError(f"Metrics stream {self.path} is closed")
+        self._queue.put(record)
+
+
+    def close(self, summary=None):
+        """
+        Write the final summary record if any, then wait for every record to be written and close the file.
+        Closing an already closed stream does nothing.
+        """
+        if self.closed:
+            return
+        if summary is not None:
+            self._queue.put(dict(summary, type="summary"))
+        self.closed = True
+        self._queue.put(None) # tells the writer thread to stop
+        self._thread.join()
+        self._file.close()
+        atexit.unregister(self.close)
+
+
+    def _write_records(self):
+        """
+        Loop of the writer thread
+        """
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = False
+
+            if record is None:
+                self._file.flush()
+                return
+            if record is not False:
+                self._file.write(json.dumps(record, default=_to_json) + "\n")
+            if self._queue.empty() or time.monotonic() - last_flush > self.flush_interval:
+                self._file.flush()
+                last_flush = time.monotonic()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _to_json(value):
+    """Serialize the numpy values of the records"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def read_metrics_stream(path):
+    """
+    Return the records of a metrics stream file, ignoring a last line cut by a crash
+    """
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
@@ -4,16 +4,24 @@ import numpy as np
 from mesa import Model
 from mesa.time import RandomActivation
 import sys
+import logging
 
 # for the fuzzy logic
 import numpy as np
-from fuzzy import FuzzyModel
 from grid_utils import MultiGridWithProperties
+from spatial_index import SpatialHash
+from relationships import RelationshipStore
+from agent_store import AgentStore, TRAITS
+from density import DensityField
+from navigation import NavigationField
+from synchronous import SynchronousActivation
+import contagion
+from clustering import Clusters, collective_clustering
 
 
 from agents import PedestrianAgent
 from obstacle import Obstacle
-from trajectory import Trajectory
+from trajectory import TrajectoryLayer
 from math import sqrt
 from exit import Exit
 from math import sqrt, pi, exp
@@ -22,6 +30,11 @@ from math import sqrt, pi, exp
 import json
 from datetime import datetime
 import os
+import time
+from metrics_stream import unique_filename
+import columnar_results
+
+logger = logging.getLogger(__name__)
 
 def euclidean_dist(pt1, pt2):
     """ Return euclidean distance between two points """
@@ -29,44 +42,77 @@ def euclidean_dist(pt1, pt2):
 
 class CrowdModel(Model):
     def __init__(self, n_agents, width, height, obstacles, exit_pos, personality_function, agent_loc=False,
-                 use_fuzzy=True, enable_emotions=True, enable_relationships=True, enable_clustering=True):
-        super().__init__(seed=42)
+                 use_fuzzy=True, enable_emotions=True, enable_relationships=True, enable_clustering=True,
+                 relationship_mode="vectorized", density_mode="scan", use_navigation_field=False, activation="random",
+                 contagion_mode="vectorized", clustering_mode="vectorized", fuzzy_mode="exact", lut_resolution=11,
+                 interactive=True, seed=42, fuzzy_model=None, metrics_stream=None, profiler=None):
+        super().__init__(seed=seed)
 
          # Store configuration options
-        random.seed(42)
+        # The seed drives both the placement and personalities of the agents (global random) and the
+        # activation order (Mesa random, which Model.__new__ only seeds when the seed is a keyword argument)
+        random.seed(seed)
+        self.reset_randomizer(seed)
+        self.interactive = interactive # False to run without any print, prompt or exit of the process (cf. headless.py)
         self.use_fuzzy = use_fuzzy
         self.enable_emotions = enable_emotions
         self.enable_relationships = enable_relationships
         self.enable_clustering = enable_clustering
-        self.fuzzy_model = FuzzyModel() if self.use_fuzzy else None # Fuzzy model to compute Pd and Pv or not        
+        assert relationship_mode in ("vectorized", "loop"), f"Unknown relationship mode: {relationship_mode}"
+        self.relationship_mode = relationship_mode # "loop" keeps the original pairwise implementation as reference
+        assert clustering_mode in ("vectorized", "loop"), f"Unknown clustering mode: {clustering_mode}"
+        self.clustering_mode = clustering_mode # "loop" keeps the original clustering on agent objects as reference
+        assert contagion_mode in ("vectorized", "loop"), f"Unknown contagion mode: {contagion_mode}"
+        self.contagion_mode = contagion_mode # "loop" keeps the per-agent update_emotions as reference
+        assert density_mode in ("scan", "field"), f"Unknown density mode: {density_mode}"
+        self.density_mode = density_mode # "field" scores the cells with a density raster updated at each move
+        assert activation in ("random", "synchronous"), f"Unknown activation: {activation}"
+        self.activation = activation # "synchronous" moves all the agents at once from a snapshot (cf. synchronous.py)
+        assert fuzzy_mode in ("exact", "lookup"), f"Unknown fuzzy mode: {fuzzy_mode}"
+        # "lookup" interpolates Pd and Pv in a table of lut_resolution^5 personalities (cf. fuzzy.FuzzyLookupTable),
+        # faster but approximate near the boundaries of the rules
+        self.fuzzy_mode = fuzzy_mode
+        self.fuzzy_model = None # Fuzzy model to compute Pd and Pv or not
+        if self.use_fuzzy and fuzzy_model is not None:
+            self.fuzzy_model = fuzzy_model # already loaded, e.g. once per worker of a sweep
+        elif self.use_fuzzy:
+            from fuzzy import FuzzyModel # imported here so that scikit-fuzzy is only loaded when it is used
+            self.fuzzy_model = FuzzyModel.cached(use_lookup_table=fuzzy_mode == "lookup", lut_resolution=lut_resolution)
         self.end = False
 
         self.grid = MultiGridWithProperties(width, height, torus=False)  # Torus=False to avoid cycling edges
+        self.density_field = DensityField(width, height) if self.density_mode == "field" else None
+        self.navigation = None # geodesic distance to the exits, built once the exits and obstacles are placed
+        self.trajectories = TrajectoryLayer(width, height) # cells crossed by the agents during the step
         self.pd_sim = None
         self.pv_sim = None
 
+        self.exit = []  # Position(s) of the exit(s)
+        self.exit_agents = {} # key: position, value: Exit agent
+        self.nb_created_exits = 0
         for pos in exit_pos:
-            self.grid.set_cell_property(pos, 'is_exit', True)
-
-        
-        for i, (x, y) in enumerate(exit_pos):
-            exit_agent = Exit(f"exit-{i}", self)
-            self.grid.place_agent(exit_agent, (x, y))
+            self.add_exit(pos, update_distance=False)
+        self.update_exit_distance()
 
 
-        self.relationship_matrix = np.zeros((n_agents, n_agents)) # cf. Algorithm 6: Emotion Contagion Model
-        self.clusters = {}  # keys are cluster ids, values are agents who are part of the cluster
+        self.relationships = RelationshipStore(n_agents) # cf. Algorithm 6: Emotion Contagion Model
+        self.agent_store = AgentStore(n_agents) # state of the pedestrians, one column per attribute
+        self._scheduled_slots_key = None # cf. scheduled_slots
+        self.clusters = {}  # keys are cluster ids, values are agents who are part of the cluster (cf. cluster_arrays)
         self.cutxy = 50
         self.cutori = pi/3
+        self.spatial_index = SpatialHash(cell_size=self.cutxy * self.max_theta()) # candidate pairs for the relationships
 
         # Fill the grid with some obstacles
-        for i, (x,y) in enumerate(obstacles):
-            assert(not self.grid.out_of_bounds((x,y)))
-            obstacle = Obstacle(i, self)
-            self.grid.place_agent(obstacle, (x, y))
+        self.obstacle_agents = {} # key: position, value: Obstacle agent
+        for (x,y) in obstacles:
+            self.add_obstacle((x, y))
+
+        if use_navigation_field:
+            # Agents score the cells with the distance to the exits around the obstacles instead of the straight line
+            self.navigation = NavigationField(width, height, self.exit, self.obstacle_agents.keys())
 
-        self.schedule = RandomActivation(self)
-        self.exit = exit_pos  # Position(s) of the exit(s)
+        self.schedule = SynchronousActivation(self) if activation == "synchronous" else RandomActivation(self)
         self.max_density_per_episode = 0 
 
         self.end = False
@@ -78,6 +124,10 @@ class CrowdModel(Model):
         self.max_density_across_episodes = []
         self.needed_steps_per_agents = {} # key: agent_id, value: nb_steps
         self.agent_personalities = {} # key: agent_id, value: personality (five traits OCEAN)
+        self.agent_initial_preferences = {} # key: agent_id, value: (initial Pd, initial Pv)
+        self.step_timings = {} # key: phase of the last step, value: duration in seconds
+        self.metrics_stream = metrics_stream # MetricsStream receiving a record per step, None to keep only the final metrics
+        self.profiler = profiler # StepProfiler recording timings and counters of every step, None not to instrument
 
 
         # Create agents only on empty cells
@@ -85,25 +135,117 @@ class CrowdModel(Model):
             assert(n_agents <= len(agent_loc)), "The number of agent coordinates is not enought to cover every agents."
 
         empty_cells = [(x, y) for x in range(self.grid.width) for y in range(self.grid.height) if self.grid.is_cell_empty((x, y))]
+        # Personalities and cells are drawn first (in the same order as one agent at a time), so that Pd and Pv
+        # of all the agents are computed at once
+        personalities, cells = [], []
         for i in range(n_agents):
             if len(empty_cells) == 0:
                 break
-            personality = personality_function()
-            agent = PedestrianAgent(i, self, personality)
-            self.agent_personalities[i] = personality
-
+            personalities.append(personality_function())
             # agent_loc is an array full of agent locations (couple of coordinates)
             if agent_loc:
-                self.grid.place_agent(agent, agent_loc[i])
+                cells.append(agent_loc[i])
             else:
-                cell_i = random.randint(0, len(empty_cells)-1)
-                self.grid.place_agent(agent, empty_cells[cell_i])
-                empty_cells.pop(cell_i)
+                cells.append(empty_cells.pop(random.randint(0, len(empty_cells)-1)))
 
+        preferences = [None] * len(personalities) # None: computed by each agent (cf. fuzzy_preferences_vel_dist)
+        if self.use_fuzzy and self.fuzzy_model and personalities:
+            traits = np.array([[personality[trait] for trait in TRAITS] for personality in personalities], dtype=float)
+            preferences = zip(*(values.tolist() for values in self.fuzzy_model.compute_parameters_array(traits)))
+
+        for i, (personality, cell, agent_preferences) in enumerate(zip(personalities, cells, preferences)):
+            agent = PedestrianAgent(i, self, personality, preferences=agent_preferences)
+            self.agent_personalities[i] = personality
+            self.agent_initial_preferences[i] = (agent.initial_pd, agent.initial_pv)
+            self.grid.place_agent(agent, cell)
             self.schedule.add(agent)
             self.clusters[i] = [agent]
+
+        if self.density_field is not None:
+            self.density_field.rebuild([agent.pos for agent in self.schedule.agents])
+
+        if self.metrics_stream is not None:
+            metrics = self.get_metrics(self.metrics_stream.name)
+            self.metrics_stream.write({"type": "start", "timestamp": metrics["timestamp"],
+                                       "configuration": metrics["configuration"]})
             
 
+    def add_exit(self, pos, update_distance=True):
+        """
+        Place an exit on the grid
+        """
+        self.grid.set_cell_property(pos, 'is_exit', True)
+        exit_agent = Exit(f"exit-{self.nb_created_exits}", self)
+        self.nb_created_exits += 1
+        self.grid.place_agent(exit_agent, pos)
+        self.exit.append(pos)
+        self.exit_agents[pos] = exit_agent
+
+        if update_distance:
+            self.update_exit_distance()
+
+
+    def remove_exit(self, pos):
+        """
+        Remove the exit placed at pos
+        """
+        self.grid.set_cell_property(pos, 'is_exit', False)
+        self.grid.remove_agent(self.exit_agents.pop(pos))
+        self.exit.remove(pos)
+        self.update_exit_distance()
+
+
+    def goal_distance(self, xs, ys):
+        """
+        Distance to the nearest exit used to score the cells (xs, ys): the walking distance around
+        the obstacles when the navigation field is enabled and the cell can reach an exit, the straight line otherwise
+        """
+        distance = self.exit_distance[xs, ys]
+        if self.navigation is not None:
+            walking_distance = self.navigation.distance[xs, ys]
+            distance = np.where(np.isfinite(walking_distance), walking_distance, distance)
+        return distance
+
+
+    def add_obstacle(self, pos):
+        """
+        Place an obstacle on the grid
+        """
+        assert(not self.grid.out_of_bounds(pos))
+        obstacle = Obstacle(len(self.obstacle_agents), self)
+        self.grid.place_agent(obstacle, pos)
+        self.obstacle_agents[pos] = obstacle
+
+        if self.navigation is not None:
+            self.navigation.add_obstacle(pos)
+
+
+    def remove_obstacle(self, pos):
+        """
+        Remove the obstacle placed at pos
+        """
+        self.grid.remove_agent(self.obstacle_agents.pop(pos))
+
+        if self.navigation is not None:
+            self.navigation.remove_obstacle(pos)
+
+
+    def update_exit_distance(self):
+        """
+        Compute the euclidean distance from every cell of the grid to its nearest exit.
+        Has to be called whenever the exits change, the agents only read this raster.
+        """
+        xs = np.arange(self.grid.width)[:, None]
+        ys = np.arange(self.grid.height)[None, :]
+
+        self.exit_distance = np.full((self.grid.width, self.grid.height), np.inf)
+        for exit_x, exit_y in self.exit:
+            np.minimum(self.exit_distance, np.sqrt((xs - exit_x)**2 + (ys - exit_y)**2), out=self.exit_distance)
+
+        if self.navigation is not None:
+            self.navigation.set_exits(self.exit)
+
+
     def theta(self, dori):
         """
         Algorithm 7: Emotion Contagion Algorithm
@@ -114,17 +256,86 @@ class CrowdModel(Model):
         return 1 + exp(-(dori/self.cutori)**2)
 
 
+    def max_theta(self):
+        """
+        Upper bound of the amplification function, reached when both agents have the same orientation
+        """
+        return self.theta(0)
+
+
+    def theta_array(self, dori):
+        """
+        Vectorized version of theta, applied elementwise on an array of orientation differences
+        """
+        amplification = np.exp(-(dori/self.cutori)**2)
+        return np.where(dori > self.cutori, amplification, 1 + amplification)
+
+
     def update_relationships(self):
         """
         Algorithm 6: Emotion Contagion Algorithm
         Update neighbors and density via relationship matrix (not explicitely written)
         """
-        agents = list(self.schedule.agents)
+        if self.relationship_mode == "loop":
+            self.update_relationships_loop()
+            return
+
+        store = self.agent_store
+        # The agents on the grid, in any order: the relations are symmetric and stored sorted
+        slots = store.active_slots()
 
         # Reset the relationships
-        self.relationship_matrix = np.zeros_like(self.relationship_matrix)
+        self.relationships.clear()
+        if len(slots) < 2:
+            return
 
-        # Compute only the upper triangular part of the matrix (as it is symmetric)
+        ids = store.unique_id[slots]
+        positions = store.pos[slots].astype(float)
+        # arccos is only defined on [-1, 1]: agents moving 2 cells on an axis get nan orientations,
+        # exactly as in the loop version, and thus never fulfill the cut-off condition
+        with np.errstate(invalid='ignore'):
+            orientations = np.arccos(store.vel[slots].astype(float))
+
+        # theta is at most 2, so agents further than 2*cutxy can never be related:
+        # only the pairs of agents in neighbouring cells of the spatial index are tested
+        self.spatial_index.rebuild(positions, cell_size=self.cutxy * self.max_theta())
+        density = np.zeros(len(slots), dtype=int)
+        related_pairs = []
+        nb_candidates = 0
+        for i, j in self.spatial_index.iter_candidate_pairs():
+            nb_candidates += len(i)
+            # Compute relative distances and velocities
+            dxy = np.sqrt((positions[i, 0] - positions[j, 0])**2 + (positions[i, 1] - positions[j, 1])**2)
+            dori = np.sqrt((orientations[i, 0] - orientations[j, 0])**2 + (orientations[i, 1] - orientations[j, 1])**2)
+
+            # Case where there is a relation between the two agents
+            related = dxy < self.cutxy * self.theta_array(dori)
+            i, j, dxy = i[related], j[related], dxy[related]
+
+            # Relationships are stored with distances to then compute neighbors easily
+            related_pairs.append((ids[i], ids[j], dxy))
+            density += np.bincount(i, minlength=len(slots)) + np.bincount(j, minlength=len(slots))
+
+        if self.profiler is not None:
+            self.profiler.count("relationship_candidates", nb_candidates)
+            self.profiler.count("relationship_pairs", int(density.sum()) // 2)
+
+        # Work on the assumption that agent densities are reset during step phase
+        store.p[slots] += density
+
+        if related_pairs:
+            self.relationships.set_pairs(*(np.concatenate(column) for column in zip(*related_pairs)))
+
+
+    def update_relationships_loop(self):
+        """
+        Algorithm 6: Emotion Contagion Algorithm
+        Reference implementation of update_relationships, looping over every pair of agents
+        """
+        agents = list(self.schedule.agents)
+        related_pairs = []
+
+        # Compute each pair only once (as the relationships are symmetric)
         # In parallel, compute the density of each agent
         for i in range(len(agents)):
             agent1 = agents[i]
@@ -138,21 +349,76 @@ class CrowdModel(Model):
 
                 # Case where there is a relation between the two agents
                 if (dxy < self.cutxy * self.theta(dori)):
-                    # Relationship matrix is filled with distances to then compute neighbors easily
-                    self.relationship_matrix[agent1.unique_id, agent2.unique_id] = dxy
+                    # Relationships are stored with distances to then compute neighbors easily
+                    related_pairs.append((agent1.unique_id, agent2.unique_id, dxy))
 
                     # Work on the assumption that agent densities are reset during step phase
                     agent1.p += 1
                     agent2.p += 1
 
-        # Get the full matrix
-        self.relationship_matrix = self.relationship_matrix + self.relationship_matrix.T
+        self.relationships.clear()
+        if related_pairs:
+            self.relationships.set_pairs(*zip(*related_pairs))
+
+
+    @property
+    def clusters(self):
+        """
+        Clusters as a dict, keys are cluster ids (unique id of the center), values are agents who are part of the cluster.
+        Built on demand from cluster_arrays: change the clusters by assigning a new dict, not by editing this one
+        """
+        if self._clusters is None:
+            self._clusters = self._cluster_arrays.to_dict(self.agent_store.agents)
+        return self._clusters
+
+    @clusters.setter
+    def clusters(self, clusters):
+        self._clusters = clusters
+        self._cluster_arrays = None
+
+
+    @property
+    def cluster_arrays(self):
+        """
+        Clusters as arrays of labels and offsets (cf. clustering.Clusters)
+        """
+        if self._cluster_arrays is None:
+            self._cluster_arrays = Clusters.from_dict(self._clusters)
+        return self._cluster_arrays
 
 
     def coll_clustering_algo(self):
         """
         Algorithm 1: Collective Clustering Algorithm
         """
+        if self.clustering_mode == "loop":
+            self.coll_clustering_algo_loop()
+            return
+
+        self._cluster_arrays = collective_clustering(self.agent_store, self.relationships, self.scheduled_slots())
+        self._clusters = None
+
+
+    def scheduled_slots(self):
+        """
+        Return the slots of the agents of the scheduler, in its order. Reading the scheduler is costly for
+        large crowds, and its order only changes when it steps or gets or loses agents, so it is read once per step
+        """
+        if self.activation == "synchronous":
+            # Its agents are never reordered: they stay in the order they were added, that is the order of the slots
+            return self.agent_store.active_slots()
+        key = (self.schedule.steps, self.schedule.get_agent_count())
+        if self._scheduled_slots_key != key:
+            self._scheduled_slots = np.fromiter((agent.slot for agent in self.schedule.agents), dtype=np.int64)
+            self._scheduled_slots_key = key
+        return self._scheduled_slots
+
+
+    def coll_clustering_algo_loop(self):
+        """
+        Algorithm 1: Collective Clustering Algorithm
+        Reference implementation of coll_clustering_algo, on the agent objects
+        """
         # Initialize cluster center
         # Agent's index is supposed to correspond with its unique id (cf initialization)
         agents = {agent.unique_id: agent for agent in self.schedule.agents}
@@ -172,16 +438,14 @@ class CrowdModel(Model):
             # Get agents in increasing density order
             agent = sorted_agents_density[i]
 
-            # Get the agent with the closest distance to our current agent (avoiding the zeros distances)
-            relation_dists = self.relationship_matrix[agent.unique_id]
-            non_zero_dist = np.nonzero(relation_dists)[0]
-            
-            if len(non_zero_dist) == 0: # all distances are = 0 which means no relation at all
+            # Get the agent with the closest distance to our current agent
+            closest_agent_id = self.relationships.nearest(agent.unique_id)
+
+            if closest_agent_id is None: # no relation at all
                 self.clusters[agent.unique_id] = [agent]
                 agent.neigh = agent.unique_id
 
             else:
-                closest_agent_id = non_zero_dist[np.argmin(relation_dists[non_zero_dist])]
                 closest_agent = agents[closest_agent_id]
 
                 # Relationship and distance have already been compared in the relationships matrix update
@@ -201,6 +465,10 @@ class CrowdModel(Model):
         """
         Emotion contagion algorithm
         """
+        if self.contagion_mode == "vectorized":
+            contagion.emotion_contagion(self)
+            return
+
         for agent in self.schedule.agents:
             assert(isinstance(agent, PedestrianAgent))
             agent.update_emotions()
@@ -209,75 +477,113 @@ class CrowdModel(Model):
 
     def step(self):
         if not self.end:
+            nb_evacuated = len(self.needed_steps_per_agents)
+            self.step_timings = {}
+
             # Make the agent move
+            phase_start = time.perf_counter()
             self.remove_all_trajectories()
             self.max_density_per_episode = 0
+            self.step_timings["trajectories"] = time.perf_counter() - phase_start
+            phase_start = time.perf_counter()
             self.schedule.step()
-            print("Max density per episode: ", self.max_density_per_episode)
+            self.step_timings["agents"] = time.perf_counter() - phase_start
+            logger.info("Max density per episode: %s", self.max_density_per_episode)
 
             # Apply optional mechanisms
             if self.enable_relationships:
                 # Fill relationship matrix with distances from each relation
-                print("update relationship")
+                logger.debug("update relationship")
+                phase_start = time.perf_counter()
                 self.update_relationships()
+                self.step_timings["relationships"] = time.perf_counter() - phase_start
             
             if self.enable_clustering:
             # Update the clupdate_emotionsusters based on closest neighbor 
+                phase_start = time.perf_counter()
                 self.coll_clustering_algo()
+                self.step_timings["clustering"] = time.perf_counter() - phase_start
             
             if self.enable_emotions:
             # Apply the emotion contagion among the previously computed clusters
+                phase_start = time.perf_counter()
                 self.emotion_contagion()
+                self.step_timings["emotions"] = time.perf_counter() - phase_start
 
 
             # reported metrics
             self.nb_steps += 1
             self.max_density_across_episodes.append(self.max_density_per_episode)
+            if self.profiler is not None:
+                self.profiler.count("clusters", len(self.cluster_arrays))
+                self.profiler.end_step(self.nb_steps, self.step_timings)
+
+            if self.metrics_stream is not None:
+                self.metrics_stream.write({
+                    "type": "step",
+                    "step": self.nb_steps,
+                    "max_density": self.max_density_per_episode,
+                    "evacuated": len(self.needed_steps_per_agents) - nb_evacuated,
+                    "remaining": self.schedule.get_agent_count(),
+                    "clusters": len(self.cluster_arrays),
+                    "timings": self.step_timings,
+                })
 
             if self.max_density_per_episode == 0: # Might be clever to do that instead of looking in scheduler 
                 self.end = True
-                print("End of the simulation")
-                print("Dumping metrics in JSON file")
-                print("\n \n \n \n \n \n \n \n \n \n")
+                if self.metrics_stream is not None:
+                    summary = self.get_metrics(self.metrics_stream.name)
+                    summary["results"]["completed"] = True
+                    self.metrics_stream.close(summary=summary)
+                if not self.interactive:
+                    return
+                logger.info("End of the simulation")
+                logger.info("Dumping metrics in JSON file")
                 self.dump_metrics()
-                print("Exiting the simulation...")
+                logger.info("Exiting the simulation...")
                 sys.exit(0)
 
 
+    def move_pedestrian(self, agent, pos):
+        """
+        Move a pedestrian on the grid, keeping the density field up to date for the next agents of the step
+        """
+        previous_pos = agent.pos
+        self.grid.move_agent(agent, pos)
+        if self.density_field is not None:
+            self.density_field.move(previous_pos, pos)
+
+
+    def remove_pedestrian(self, agent):
+        """
+        Remove a pedestrian from the grid and from the scheduler
+        """
+        if self.density_field is not None:
+            self.density_field.stamp(agent.pos, -1)
+        self.grid.remove_agent(agent)
+        self.schedule.remove(agent)
+
+
     def add_trajectory(self, pos, agent_id): 
         """
         Add a trajectory to the grid
         """
-        trajectory = Trajectory(self, agent_id)
-        self.grid.place_agent(trajectory, pos)
-
-        assert trajectory.pos is not None, "creation of an agent without position"
+        assert not self.grid.out_of_bounds(pos), "creation of a trajectory outside of the grid"
+        self.trajectories.add(pos, agent_id)
 
 
     def remove_all_trajectories(self):
         """
-        Remove all trajectories object from the grid
+        Remove all trajectories from the grid, only visiting the cells where one was added
         """
-        for x in range(self.grid.width):
-            for y in range(self.grid.height):
-                for agent in self.grid.get_cell_list_contents((x, y)):
-                    if isinstance(agent, Trajectory): 
-                        self.grid.remove_agent(agent)
-        Trajectory.trajectory_counter = 0
+        self.trajectories.clear()
 
 
-    def dump_metrics(self):
+    def get_metrics(self, simulation_name):
         """
-        Dumps simulation metrics to a JSON file with structured information
+        Return the simulation metrics as a dict with structured information (cf. dump_metrics)
         """
-
-        # Ensure the 'results' directory exists
-        if not os.path.exists('results'):
-            os.makedirs('results')
-        
-        print("Please enter a name for the simulation :")
-        simulation_name = input()
-        metrics = {
+        return {
             "simulation_name": simulation_name,
             "timestamp": datetime.now().isoformat(),
             "configuration": {
@@ -302,12 +608,35 @@ class CrowdModel(Model):
                 }
             }
         }
+
+
+    def dump_metrics(self):
+        """
+        Dumps simulation metrics to a JSON file with structured information
+        """
+
+        # Ensure the 'results' directory exists
+        if not os.path.exists('results'):
+            os.makedirs('results')
+        
+        print("Please enter a name for the simulation :")
+        simulation_name = input()
+        metrics = self.get_metrics(simulation_name)
     
-        # Create filename with timestamp to avoid overwrites
-        filename = f"results/simulation_metrics_{datetime.now().strftime('%Y%m%d_%H%M')}.json"
+        # Create filename with timestamp (and process id and random suffix) to avoid overwrites, even by parallel runs
+        filename = unique_filename("results", "simulation_metrics", ".json")
         
         # Write to file with pretty printing
         with open(filename, 'w') as f:
             json.dump(metrics, f, indent=4)
         
-        return filename
\ No newline at end of file
+        return filename
+
+
+    def dump_columns(self, simulation_name, directory="results"):
+        """
+        Dumps simulation metrics in the columnar binary format (cf. columnar_results), faster than the JSON
+        of dump_metrics for large crowds, and return the path of the run directory
+        """
+        path = unique_filename(directory, "simulation_metrics", "")
+        return columnar_results.write_run(self, path, simulation_name)
@@ -0,0 +1,146 @@
+import heapq
+import numpy as np
+from math import sqrt
+
+
+class NavigationField:
+    """
+    Geodesic distance from every cell of the grid to the nearest exit, going around the obstacles.
+
+    The field is computed with a multi-source Dijkstra from all the exit cells over the 8-connected grid
+    (the moves allowed to the agents, diagonal steps costing sqrt(2)). The shortest-path tree is kept
+    so that adding or removing an obstacle only recomputes the part of the field it affects.
+    Cells that can not reach any exit (and obstacle cells) have an infinite distance.
+    """
+
+    MOVES = [(dx, dy, sqrt(dx**2 + dy**2)) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)]
+
+    def __init__(self, width, height, exits, obstacles):
+        self.width = width
+        self.height = height
+        self.blocked = np.zeros((width, height), dtype=bool)
+        for pos in obstacles:
+            self.blocked[pos] = True
+        self.set_exits(exits)
+
+
+    def set_exits(self, exits):
+        """
+        Change the exits, which requires to recompute the whole field
+        """
+        self.exits = list(exits)
+        self.compute()
+
+
+    def compute(self):
+        """
+        Compute the whole field from scratch
+        """
+        self.distance = np.full((self.width, self.height), np.inf)
+        # parent[x, y] is the flat index of the next cell on the shortest path, the cell itself for exits
+        self.parent = np.arange(self.width * self.height).reshape(self.width, self.height)
+
+        heap = []
+        for pos in self.exits:
+            if not self.blocked[pos]:
+                self.distance[pos] = 0.0
+                heap.append((0.0, pos[0] * self.height + pos[1]))
+        heapq.heapify(heap)
+        self._propagate(heap)
+
+
+    def _propagate(self, heap):
+        """
+        Dijkstra from the cells of the heap, whose distance is already set
+        """
+        # Plain lists are much faster than numpy arrays for element-wise accesses
+        distance = self.distance.ravel().tolist()
+        parent = self.parent.ravel().tolist()
+        blocked = self.blocked.ravel().tolist()
+        width, height = self.width, self.height
+
+        while heap:
+            dist, index = heapq.heappop(heap)
+            if dist > distance[index]:
+                continue
+
+            x, y = divmod(index, height)
+            for dx, dy, cost in self.MOVES:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    neighbor = nx * height + ny
+                    if not blocked[neighbor] and dist + cost < distance[neighbor]:
+                        distance[neighbor] = dist + cost
+                        parent[neighbor] = index
+                        heapq.heappush(heap, (dist + cost, neighbor))
+
+        self.distance = np.array(distance).reshape(width, height)
+        self.parent = np.array(parent).reshape(width, height)
+
+
+    def _descendants(self, pos):
+        """
+        Return the mask of the cells whose shortest path goes through pos (pos included)
+        """
+        parent = self.parent.ravel()
+        descendant = np.zeros(len(parent), dtype=bool)
+        descendant[pos[0] * self.height + pos[1]] = True
+
+        # Pointer jumping: after k iterations ancestor[i] is the 2^k-th ancestor of i
+        ancestor = parent.copy()
+        while True:
+            descendant |= descendant[ancestor]
+            next_ancestor = ancestor[ancestor]
+            if np.array_equal(next_ancestor, ancestor):
+                return descendant.reshape(self.width, self.height)
+            ancestor = next_ancestor
+
+
+    def add_obstacle(self, pos):
+        """
+        Block a cell: only the cells whose shortest path went through it are recomputed
+        """
+        if self.blocked[pos]:
+            return
+
+        invalid = self._descendants(pos) & np.isfinite(self.distance)
+        self.blocked[pos] = True
+        self.distance[invalid] = np.inf
+        self.parent.ravel()[invalid.ravel()] = np.flatnonzero(invalid)
+
+        # Restart the propagation from the valid cells bordering the invalidated region
+        border = np.zeros_like(invalid)
+        for dx, dy, _ in self.MOVES:
+            # cells[i] and neighbors[i] are the cells (x, y) and (x+dx, y+dy) both inside the grid
+            cells = (slice(max(0, -dx), self.width - max(0, dx)), slice(max(0, -dy), self.height - max(0, dy)))
+            neighbors = (slice(max(0, dx), self.width + min(0, dx)), slice(max(0, dy), self.height + min(0, dy)))
+            border[cells] |= invalid[neighbors]
+        border &= np.isfinite(self.distance) & ~self.blocked
+
+        xs, ys = np.nonzero(border)
+        heap = list(zip(self.distance[xs, ys].tolist(), (xs * self.height + ys).tolist()))
+        heapq.heapify(heap)
+        self._propagate(heap)
+
+
+    def remove_obstacle(self, pos):
+        """
+        Free a cell: distances can only decrease, and only through this cell
+        """
+        if not self.blocked[pos]:
+            return
+
+        self.blocked[pos] = False
+        index = pos[0] * self.height + pos[1]
+        if pos in self.exits:
+            self.distance[pos] = 0.0
+        else:
+            for dx, dy, cost in self.MOVES:
+                neighbor = (pos[0] + dx, pos[1] + dy)
+                if 0 <= neighbor[0] < self.width and 0 <= neighbor[1] < self.height:
+                    if self.distance[neighbor] + cost < self.distance[pos]:
+                        self.distance[pos] = self.distance[neighbor] + cost
+                        self.parent[pos] = neighbor[0] * self.height + neighbor[1]
+
+        if np.isfinite(self.distance[pos]):
+            self._propagate([(float(self.distance[pos]), index)])
@@ -1,5 +1,7 @@
 from mesa import Agent
 
 class Obstacle(Agent):
+    layer = "obstacle" # cf. MultiGridWithProperties layers
+
     def __init__(self, unique_id, model):
         super().__init__(unique_id, model)
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Opt-in instrumentation of CrowdModel.step: the duration of each phase of a step (cf. CrowdModel.step_timings)
+and counters of the work done in the hot paths (agent moves, candidate cells, get_density calls,
+pairs tested for the relationships...), kept as a table with one row per step.
+
+Usage:
+    profiler = StepProfiler()
+    model = CrowdModel(..., profiler=profiler)
+    ...
+    profiler.table()        # one dict per step
+    profiler.dump("results/profile.json")
+
+Without a profiler (the default), the model only pays a test against None at each instrumented call.
+"""
+import json
+import os
+from collections import defaultdict
+
+
+class StepProfiler:
+    """
+    Per-step table of the phase timings and counters of a CrowdModel
+    """
+
+    def __init__(self):
+        self.rows = [] # one dict per step: step, time of each phase (time_<phase>) and counters
+        self.counters = defaultdict(int) # counters of the current step
+
+
+    def count(self, name, value=1):
+        """
+        Add value to a counter of the current step
+        """
+        self.counters[name] += value
+
+
+    def end_step(self, step, timings):
+        """
+        Close the current step: record its timings and counters as a row and reset the counters
+
+        input :
+        - step : int, the number of the step
+        - timings : dict, the duration in seconds of each phase of the step
+        """
+        row = {"step": step}
+        row.update((f"time_{phase}", duration) for phase, duration in timings.items())
+        row.update(self.counters)
+        if self.counters.get("agent_moves"):
+            row["candidates_per_agent"] = self.counters["candidates"] / self.counters["agent_moves"]
+        self.rows.append(row)
+        self.counters = defaultdict(int)
+
+
+    def table(self):
+        """
+        Return the rows of the steps recorded so far (a list of dict, e.g. for pandas.DataFrame)
+        """
+        return self.rows
+
+
+    def summary(self):
+        """
+        Return the total and the mean per step of every column of the table
+        """
+        columns = sorted({column for row in self.rows for column in row} - {"step"})
+        summary = {}
+        for column in columns:
+            values = [row.get(column, 0) for row in self.rows]
+            summary[column] = {"total": sum(values), "mean": sum(values) / len(values)}
+        return summary
+
+
+    def dump(self, path):
+        """
+        Write the table and its summary to a JSON profile file, return its path
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({"summary": self.summary(), "steps": self.rows}, f, indent=4)
+        return path
@@ -0,0 +1,88 @@
+import numpy as np
+
+
+class RelationshipStore:
+    """
+    Sparse and symmetric storage of the relations between agents (cf. Algorithm 6: Emotion Contagion Model)
+
+    Relations are kept in compressed sparse rows indexed by agent unique id: the related agents of
+    agent i are indices[indptr[i]:indptr[i+1]] (sorted by id) and the distances to them are stored
+    at the same positions in distances. The memory grows with the number of relations instead of n_agents².
+    """
+
+    def __init__(self, n_agents):
+        self.n_agents = n_agents
+        self.clear()
+
+
+    def clear(self):
+        """Remove every relation"""
+        self.indptr = np.zeros(self.n_agents + 1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int64)
+        self.distances = np.empty(0, dtype=float)
+
+
+    def set_pairs(self, agents1, agents2, distances):
+        """
+        Replace the relations by the given ones, each unordered pair of agents being given only once
+
+        input :
+        - agents1, agents2 : arrays of int, the unique ids of the related agents
+        - distances : array of float, the distance between the agents of each pair
+        """
+        agents1 = np.asarray(agents1, dtype=np.int64)
+        agents2 = np.asarray(agents2, dtype=np.int64)
+        distances = np.asarray(distances, dtype=float)
+
+        # Store both directions so that a row holds all the relations of an agent
+        rows = np.concatenate((agents1, agents2))
+        cols = np.concatenate((agents2, agents1))
+        order = np.lexsort((cols, rows))
+
+        self.indices = cols[order]
+        self.distances = np.concatenate((distances, distances))[order]
+        self.indptr = np.zeros(self.n_agents + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self.n_agents), out=self.indptr[1:])
+
+
+    def row(self, agent_id):
+        """
+        Return the ids of the agents related to agent_id and the distances to them
+        """
+        start, end = self.indptr[agent_id], self.indptr[agent_id + 1]
+        return self.indices[start:end], self.distances[start:end]
+
+
+    def nearest(self, agent_id):
+        """
+        Return the id of the closest agent related to agent_id (lowest id in case of tie), None if it has no relation
+        """
+        ids, distances = self.row(agent_id)
+        if len(ids) == 0:
+            return None
+        return int(ids[np.argmin(distances)])
+
+
+    def nearest_all(self):
+        """
+        Return an array holding for each agent id the id of its closest related agent (lowest id in case of tie),
+        -1 for agents without any relation
+        """
+        nearest = np.full(self.n_agents, -1, dtype=np.int64)
+        if len(self.indices) == 0:
+            return nearest
+
+        # Minimum distance of each row with relations, then the first position of the row reaching it:
+        # ids being sorted inside rows, it is the lowest id in case of tie
+        counts = np.diff(self.indptr)
+        has_relation = counts > 0
+        starts = self.indptr[:-1][has_relation]
+        minimums = np.minimum.reduceat(self.distances, starts)
+        reached = np.flatnonzero(self.distances == np.repeat(minimums, counts[has_relation]))
+        nearest[has_relation] = self.indices[reached[np.searchsorted(reached, starts)]]
+        return nearest
+
+
+    def __len__(self):
+        """Number of unordered pairs of related agents"""
+        return len(self.indices) // 2
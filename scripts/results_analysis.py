@@ -1,7 +1,40 @@
+import glob
+import hashlib
+import itertools
 import json
+import os
+import pickle
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+import columnar_results
+
+TRAITS = ['O', 'C', 'E', 'A', 'N']
+
+# Directory where the parsed runs are cached
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'results_analysis')
+# Version of the parsed runs (cf. _parse_run), to increase whenever they change so that the cached ones are parsed again
+CACHE_VERSION = 2
+
+
+def evacuation_curve(steps, length: int = None) -> np.ndarray:
+    """
+    Number of agents evacuated at each step (evacuated at this step or before)
+
+    Parameters:
+    -----------
+    steps : array of int
+        Step at which each evacuated agent got out
+    length : int
+        Length of the curve, by default up to the last evacuation
+    """
+    steps = np.asarray(steps, dtype=np.int64)
+    if length is None:
+        length = steps.max() + 1 if len(steps) else 1
+    return np.cumsum(np.bincount(steps, minlength=length)[:length])
 
 class Result_analysis:
     def __init__(self, json_path: str, figure_size: tuple = (12, 6)):
@@ -11,19 +44,46 @@ class Result_analysis:
         Parameters:
         -----------
         json_path : str
-            Path to the JSON file containing simulation data
+            Path to the JSON file containing simulation data (or the result of a sweep run, cf. sweep.py),
+            or to a run directory in the columnar format (cf. columnar_results), whose columns are memory-mapped
         figure_size : tuple
             Default size for matplotlib figures
         """
         self.figure_size = figure_size
-        self.data = self._load_data(json_path)
-        self.personalities_df = self._process_personalities()
-        self.steps_df = self._process_steps()
+        self.parameters = None # parameters of the run when it is the result of a sweep
+        self.sweep = None # key of the base scenario and seed of that sweep (cf. sweep.base_key)
+        if columnar_results.is_run(json_path):
+            self.data, self.columns = columnar_results.load_run(json_path)
+            self.personalities_df, self.steps_df, self.preferences_df = self._process_columns()
+            self.max_densities = self.columns['step_max_density']
+        else:
+            self.data = self._load_data(json_path)
+            self.columns = None
+            self.personalities_df = self._process_personalities()
+            self.steps_df = self._process_steps()
+            self.preferences_df = None # initial Pd and Pv are only stored in the columnar format
+            self.max_densities = self.data['results']['density_metrics']['max_density_across_episodes']
         
+    def _process_columns(self) -> tuple:
+        """Build the personalities, steps and initial preferences DataFrames from the columns, without copying them"""
+        ids = pd.Index(self.columns['agent_id'])
+        personalities = pd.DataFrame(self.columns['agent_traits'], index=ids, columns=columnar_results.TRAITS, copy=False)
+        preferences = pd.DataFrame({'pd': self.columns['agent_initial_pd'], 'pv': self.columns['agent_initial_pv']},
+                                   index=ids, copy=False)
+        exit_steps = self.columns['agent_exit_step']
+        evacuated = exit_steps >= 0
+        steps = pd.DataFrame({'steps': exit_steps[evacuated]}, index=ids[evacuated])
+        return personalities, steps, preferences
+
     def _load_data(self, json_path: str) -> dict:
-        """Load JSON data from file"""
+        """Load JSON data from file, the metrics of a sweep result (cf. sweep.execute_run) being unwrapped"""
         with open(json_path, 'r') as f:
-            return json.load(f)
+            data = json.load(f)
+        if 'metrics' in data:
+            self.parameters = data.get('parameters')
+            self.sweep = data.get('base')
+            data = data['metrics']
+        return data
             
     def _process_personalities(self) -> pd.DataFrame:
         """Convert personalities dict to DataFrame"""
@@ -45,8 +105,7 @@ class Result_analysis:
     def plot_density_over_time(self, title: str = "Maximum Density Evolution Over Time"):
         """Plot the maximum density evolution over simulation steps"""
         plt.figure(figsize=self.figure_size)
-        densities = self.data['results']['density_metrics']['max_density_across_episodes']
-        plt.plot(densities, linewidth=2)
+        plt.plot(self.max_densities, linewidth=2)
         plt.title(title)
         plt.xlabel("Simulation Step")
         plt.ylabel("Maximum Density")
@@ -133,12 +192,7 @@ class Result_analysis:
         
     def plot_evacuation_timeline(self, title: str = "Evacuation Timeline"):
         """Plot the cumulative percentage of evacuated agents over time"""
-        max_steps = self.steps_df['steps'].max()
-        evacuated = np.zeros(max_steps + 1)
-        
-        for steps in self.steps_df['steps']:
-            evacuated[steps:] += 1
-            
+        evacuated = evacuation_curve(self.steps_df['steps'].to_numpy())
         evacuated_pct = (evacuated / len(self.steps_df)) * 100
         
         plt.figure(figsize=self.figure_size)
@@ -158,6 +212,283 @@ class Result_analysis:
         self.plot_trait_influence()
         self.plot_evacuation_timeline()
 
+def _parse_run(path: str) -> dict:
+    """Parse a run (JSON file or columnar run directory) into the frames used by MultiRunAnalysis (cf. CACHE_VERSION)"""
+    analysis = Result_analysis(path)
+    steps = analysis.steps_df.copy()
+    steps.index = steps.index.astype(int)
+    personalities = analysis.personalities_df.copy() # also reads the memory-mapped columns
+    personalities.index = personalities.index.astype(int)
+    return {
+        'path': path,
+        'personalities': personalities,
+        'steps': steps,
+        'max_densities': np.array(analysis.max_densities, dtype=float),
+        'n_agents': len(personalities),
+        'parameters': analysis.parameters,
+        'sweep': analysis.sweep,
+    }
+
+
+def _modification_time(path: str) -> float:
+    """Modification time of a run, the one of its meta.json for a columnar run directory"""
+    if os.path.isdir(path):
+        path = os.path.join(path, 'meta.json')
+    return os.path.getmtime(path)
+
+
+class MultiRunAnalysis:
+    def __init__(self, results: str = "results", figure_size: tuple = (12, 6), confidence: float = 0.95,
+                 cache_dir: str = DEFAULT_CACHE_DIR, max_workers: int = None):
+        """
+        Aggregate the results of several runs (e.g. the replicates of a configuration), each plot of
+        Result_analysis being drawn as the mean across runs with its confidence band. The runs of a sweep
+        (cf. sweep.py) are grouped by their parameters, each configuration getting its own band.
+        
+        Parameters:
+        -----------
+        results : str
+            Directory of the results (its simulation_metrics JSON files, columnar run directories and
+            run_*.json sweep results are used) or glob pattern of the runs
+        figure_size : tuple
+            Default size for matplotlib figures
+        confidence : float
+            Level of the confidence bands (normal approximation of the mean)
+        cache_dir : str
+            Directory where the parsed runs are cached, a run being parsed again only when its file changes
+            (None to disable the cache)
+        max_workers : int
+            Number of processes parsing the runs (number of CPUs by default)
+        """
+        self.figure_size = figure_size
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.confidence = confidence
+        self.cache_dir = cache_dir
+        self.paths = self._find_runs(results)
+        self.runs = self._load_runs(max_workers)
+        self.groups = self._group_runs()
+
+    def _find_runs(self, results: str) -> list:
+        """List the runs of a directory or matching a glob pattern"""
+        if os.path.isdir(results) and not columnar_results.is_run(results):
+            patterns = [os.path.join(results, 'simulation_metrics_*'), os.path.join(results, 'run_*.json')]
+        else:
+            patterns = [results]
+        paths = [path for path in sorted(set(itertools.chain.from_iterable(glob.glob(pattern) for pattern in patterns)))
+                 if path.endswith('.json') or columnar_results.is_run(path)]
+        if not paths:
+            raise FileNotFoundError(f"No simulation results found for {results}")
+        return paths
+
+    def _cache_path(self, path: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(os.path.abspath(path).encode()).hexdigest() + '.pkl')
+
+    def _load_runs(self, max_workers: int) -> list:
+        """
+        Parse the runs in parallel, except those whose parsed frames are cached for their current modification time
+        by this version of _parse_run (cf. CACHE_VERSION)
+        """
+        runs = [None] * len(self.paths)
+        to_parse = []
+        for i, path in enumerate(self.paths):
+            if self.cache_dir is not None and os.path.exists(self._cache_path(path)):
+                with open(self._cache_path(path), 'rb') as f:
+                    cached = pickle.load(f)
+                if cached.get('version') == CACHE_VERSION and cached['mtime'] == _modification_time(path):
+                    runs[i] = cached['run']
+                    continue
+            to_parse.append(i)
+
+        if to_parse:
+            with ProcessPoolExecutor(max_workers) as executor:
+                parsed = executor.map(_parse_run, [self.paths[i] for i in to_parse])
+                for i, run in zip(to_parse, parsed):
+                    runs[i] = run
+                    if self.cache_dir is not None:
+                        os.makedirs(self.cache_dir, exist_ok=True)
+                        with open(self._cache_path(self.paths[i]), 'wb') as f:
+                            pickle.dump({'version': CACHE_VERSION, 'mtime': _modification_time(self.paths[i]), 'run': run}, f)
+        return runs
+
+    def _group_runs(self) -> dict:
+        """
+        Group the runs by configuration (key: the parameters of the sweep as a label, None for runs
+        that are not the result of a sweep; value: list of runs), in the order of the runs. The runs of
+        different sweeps (other base scenario or seed) are not grouped together.
+        """
+        several_sweeps = len({run['sweep'] for run in self.runs if run['parameters'] is not None}) > 1
+        groups = {}
+        for run in self.runs:
+            parameters = run['parameters']
+            label = None if parameters is None else ", ".join(
+                f"{name}={json.dumps(value)}" for name, value in sorted(parameters.items()))
+            if several_sweeps and parameters is not None:
+                label = f"sweep {run['sweep']}: {label}"
+            groups.setdefault(label, []).append(run)
+        return groups
+
+    def _mean_band(self, values: np.ndarray) -> tuple:
+        """Mean across runs (first axis, nan for missing values) and half-width of its confidence band"""
+        counts = np.sum(~np.isnan(values), axis=0)
+        with warnings.catch_warnings(): # positions with less than 2 runs have no band
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean = np.nanmean(values, axis=0)
+            std = np.nanstd(values, axis=0, ddof=1)
+        half_width = self.z * np.nan_to_num(std) / np.sqrt(np.maximum(counts, 1))
+        return mean, half_width
+
+    def _plot_band(self, x, values: np.ndarray, label: str = None):
+        mean, half_width = self._mean_band(values)
+        plt.plot(x, mean, linewidth=2, label=label)
+        plt.fill_between(x, mean - half_width, mean + half_width, alpha=0.3)
+
+    def _band_label(self, group: str = None, runs: list = None) -> str:
+        """Legend of the band of a configuration (of all the runs by default)"""
+        runs = self.runs if runs is None else runs
+        label = f"mean of {len(runs)} runs, {self.confidence:.0%} confidence band"
+        return label if group is None else f"{group} ({label})"
+
+    def _plot_grouped_bars(self, means: list, half_widths: list, annotate: bool = False):
+        """
+        Plot, for each configuration, its mean value of each trait with its band, the bars of a trait side by side
+        (with their value written above them if annotate)
+        """
+        width = 0.8 / len(self.groups)
+        x = np.arange(len(TRAITS))
+        for g, ((group, runs), mean, half_width) in enumerate(zip(self.groups.items(), means, half_widths)):
+            bars = plt.bar(x + (g - (len(self.groups) - 1) / 2) * width, mean, width, yerr=half_width, capsize=5,
+                           label=self._band_label(group, runs))
+            for bar, height in zip(bars, mean if annotate else []):
+                plt.text(bar.get_x() + bar.get_width()/2., height, f'{height:.1f}', ha='center', va='bottom')
+        plt.xticks(x, TRAITS)
+        if len(self.groups) > 1:
+            plt.legend()
+
+    def evacuation_curves(self, percentage: bool = True, runs: list = None) -> np.ndarray:
+        """
+        Evacuation curve of each run (runs x steps, all the runs by default), extended with the final value
+        after the end of the shorter runs
+        """
+        runs = self.runs if runs is None else runs
+        length = max(int(run['steps']['steps'].max()) + 1 if len(run['steps']) else 1 for run in runs)
+        curves = np.array([evacuation_curve(run['steps']['steps'].to_numpy(), length) for run in runs], dtype=float)
+        if percentage: # of the agents evacuated by the end of the run, as Result_analysis does
+            curves *= 100 / np.maximum([[len(run['steps'])] for run in runs], 1)
+        return curves
+
+    def plot_density_over_time(self, title: str = "Maximum Density Evolution Over Time"):
+        """Plot the mean maximum density over simulation steps for each configuration, runs that already ended being left out"""
+        plt.figure(figsize=self.figure_size)
+        for group, runs in self.groups.items():
+            length = max(len(run['max_densities']) for run in runs)
+            densities = np.full((len(runs), length), np.nan)
+            for i, run in enumerate(runs):
+                densities[i, :len(run['max_densities'])] = run['max_densities']
+            self._plot_band(np.arange(length), densities, self._band_label(group, runs))
+        plt.title(title)
+        plt.xlabel("Simulation Step")
+        plt.ylabel("Maximum Density")
+        plt.legend()
+        plt.grid(True)
+        plt.show()
+
+    def plot_personality_distributions(self, title: str = "Distribution of Personality Traits"):
+        """Plot the mean value of each personality trait across the runs of each configuration"""
+        bands = [self._mean_band(np.array([run['personalities'][TRAITS].mean().to_numpy() for run in runs]))
+                 for runs in self.groups.values()]
+        plt.figure(figsize=self.figure_size)
+        self._plot_grouped_bars([mean for mean, _ in bands], [half_width for _, half_width in bands])
+        plt.title(title)
+        plt.ylabel(f"Mean Trait Value (mean across runs, {self.confidence:.0%} confidence band)")
+        plt.grid(True)
+        plt.show()
+
+    def plot_steps_distribution(self, title: str = "Distribution of Steps Needed for Evacuation", bins: int = 30):
+        """Plot the mean histogram of the steps needed for evacuation of each configuration, on bins common to every run"""
+        all_steps = np.concatenate([run['steps']['steps'].to_numpy() for run in self.runs])
+        edges = np.histogram_bin_edges(all_steps, bins=bins)
+        plt.figure(figsize=self.figure_size)
+        for group, runs in self.groups.items():
+            counts = np.array([np.histogram(run['steps']['steps'], bins=edges)[0] for run in runs], dtype=float)
+            mean, half_width = self._mean_band(counts)
+            stairs = plt.stairs(mean, edges, fill=len(self.groups) == 1, edgecolor='black' if len(self.groups) == 1 else None,
+                                linewidth=2, label=self._band_label(group, runs))
+            color = 'black' if len(self.groups) == 1 else stairs.get_edgecolor()
+            plt.errorbar((edges[:-1] + edges[1:]) / 2, mean, yerr=half_width, fmt='none', ecolor=color, capsize=3)
+        plt.title(title)
+        plt.xlabel("Number of Steps")
+        plt.ylabel("Count")
+        plt.legend()
+        plt.grid(True)
+        plt.show()
+
+    def plot_personality_vs_steps(self, title: str = "Correlation: Personality Traits vs Steps Needed"):
+        """
+        Plot the mean correlation between personality traits and steps needed, with the half-width of its band,
+        one matrix per configuration
+        """
+        labels = TRAITS + ['steps']
+        fig, axes = plt.subplots(1, len(self.groups), squeeze=False,
+                                 figsize=(self.figure_size[0] * len(self.groups), self.figure_size[1]))
+        for ax, (group, runs) in zip(axes[0], self.groups.items()):
+            matrices = []
+            for run in runs:
+                merged_df = pd.merge(run['personalities'], run['steps'], left_index=True, right_index=True)
+                matrices.append(merged_df.corr().to_numpy())
+            mean, half_width = self._mean_band(np.array(matrices))
+
+            im = ax.imshow(mean, cmap='coolwarm', aspect='auto', vmin=-1, vmax=1)
+            fig.colorbar(im, ax=ax)
+            for i in range(len(labels)):
+                for j in range(len(labels)):
+                    ax.text(j, i, f'{mean[i, j]:.2f}\n±{half_width[i, j]:.2f}', ha='center', va='center')
+            ax.set_xticks(range(len(labels)), labels, rotation=45)
+            ax.set_yticks(range(len(labels)), labels)
+            ax.set_title(title if group is None else f"{title}\n{group}")
+        fig.tight_layout()
+        plt.show()
+
+    def plot_trait_influence(self, title: str = "Average Steps Needed by Dominant Trait"):
+        """Plot, for each configuration, the mean across runs of the average steps needed for agents with highest values in each trait"""
+        bands = []
+        for runs in self.groups.values():
+            averages = []
+            for run in runs:
+                merged_df = pd.merge(run['personalities'], run['steps'], left_index=True, right_index=True)
+                averages.append([merged_df[merged_df[trait] >= merged_df[trait].quantile(0.9)]['steps'].mean()
+                                 for trait in TRAITS])
+            bands.append(self._mean_band(np.array(averages)))
+
+        plt.figure(figsize=self.figure_size)
+        self._plot_grouped_bars([mean for mean, _ in bands], [half_width for _, half_width in bands], annotate=True)
+        plt.title(title)
+        plt.xlabel("Personality Trait")
+        plt.ylabel(f"Average Steps (Top 10% in trait, mean across runs, {self.confidence:.0%} confidence band)")
+        plt.grid(True)
+        plt.show()
+
+    def plot_evacuation_timeline(self, title: str = "Evacuation Timeline"):
+        """Plot the mean cumulative percentage of evacuated agents over time for each configuration"""
+        plt.figure(figsize=self.figure_size)
+        for group, runs in self.groups.items():
+            curves = self.evacuation_curves(runs=runs)
+            self._plot_band(np.arange(curves.shape[1]), curves, self._band_label(group, runs))
+        plt.title(title)
+        plt.xlabel("Simulation Step")
+        plt.ylabel("Percentage of Evacuated Agents")
+        plt.legend()
+        plt.grid(True)
+        plt.show()
+
+    def plot_all(self):
+        """Generate all available plots with default titles"""
+        self.plot_density_over_time()
+        self.plot_personality_distributions()
+        self.plot_steps_distribution()
+        self.plot_personality_vs_steps()
+        self.plot_trait_influence()
+        self.plot_evacuation_timeline()
+
 if __name__ == "__main__":
     analyzer = Result_analysis("results/simulation_metrics_20241224_1204.json")
     
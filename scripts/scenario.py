@@ -0,0 +1,189 @@
+"""
+Description of a simulation (grid, exits, obstacles, agents, personality distribution, features and seed),
+shared by the visualisation and the headless runner, and loading of the JSON scenario files.
+
+Scenario file example:
+{
+    "name": "two_exits",
+    "grid": {"width": 50, "height": 50},
+    "exits": {"bottom": 1, "top": 0, "left": 0, "right": 1},
+    "obstacles": [[25, 10], [25, 11]],
+    "n_agents": 200,
+    "personality": "random",
+    "features": {"use_fuzzy": true, "density_mode": "field"},
+    "seed": 0,
+    "max_steps": 500
+}
+"exits" is either a list of cells or the number of exits on each side of the grid (cf. generate_exits),
+"agent_locations" can give the initial cells of the agents, "max_steps" is null to run until every agent is out.
+"""
+import json
+import random
+
+TRAITS = ['O', 'C', 'E', 'A', 'N']
+
+
+def random_personality():
+        personality = {}
+        for trait in TRAITS:
+            mu = random.uniform(0, 1)
+            sigma = random.uniform(-0.1, 0.1)
+            personality[trait] = random.gauss(mu, sigma**2)
+            # Personality[trait] = max(0, min(1, random.gauss(mu, abs(sigma))))
+        return personality
+
+
+def full_N():
+    personality = {}
+    for trait in TRAITS:
+        if trait == 'N':
+            personality[trait] = 1
+        else:
+            mu = random.uniform(0, 1)
+            sigma = random.uniform(-0.1, 0.1)
+            personality[trait] = random.gauss(mu, sigma**2)
+    return personality
+
+
+def only_N():
+    personality = {}
+    for trait in TRAITS:
+        if trait == 'N':
+            personality[trait] = 1
+        else:
+            personality[trait] = 0
+    return personality
+
+
+# Personality distributions, by the name used in the scenarios and in the interactive menu
+PERSONALITY_FUNCTIONS = {
+    "random": random_personality,
+    "fully N": full_N,
+    "only N": only_N,
+}
+
+# Options of CrowdModel that a scenario can set in "features"
+FEATURES = {
+    "use_fuzzy": True,
+    "enable_emotions": True,
+    "enable_relationships": True,
+    "enable_clustering": True,
+    "relationship_mode": "vectorized",
+    "contagion_mode": "vectorized",
+    "clustering_mode": "vectorized",
+    "density_mode": "scan",
+    "use_navigation_field": False,
+    "activation": "random",
+    "fuzzy_mode": "exact",
+    "lut_resolution": 11,
+}
+
+
+def generate_exits(width, height, bottom=1, top=1, left=1, right=1):
+    """
+    Return the cells of exits evenly spread on each side of the grid, each exit being 5 cells wide
+
+    input :
+    - width, height : int, the dimensions of the grid
+    - bottom, top, left, right : int, the number of exits on each side
+    """
+    exit_pos = []
+    for i in range(bottom):
+        center = width // (bottom + 1) * (i + 1)
+        exit_pos.append((center, 0))
+        if center - 1 >= 0:
+            exit_pos.append((center - 1, 0))
+            if center - 2 >= 0:
+                exit_pos.append((center - 2, 0))
+        if center + 1 < width:
+            exit_pos.append((center + 1, 0))
+            if center + 2 < width:
+                exit_pos.append((center + 2, 0))
+    for i in range(top):
+        center = width // (top + 1) * (i + 1)
+        exit_pos.append((center, height - 1))
+        if center - 1 >= 0:
+            exit_pos.append((center - 1, height - 1))
+            if center - 2 >= 0:
+                exit_pos.append((center - 2, height - 1))
+        if center + 1 < width:
+            exit_pos.append((center + 1, height - 1))
+            if center + 2 < width:
+                exit_pos.append((center + 2, height - 1))
+    for i in range(left):
+        center = height // (left + 1) * (i + 1)
+        exit_pos.append((0, center))
+        if center - 1 >= 0:
+            exit_pos.append((0, center - 1))
+            if center - 2 >= 0:
+                exit_pos.append((0, center - 2))
+        if center + 1 < height:
+            exit_pos.append((0, center + 1))
+            if center + 2 < height:
+                exit_pos.append((0, center + 2))
+    for i in range(right):
+        center = height // (right + 1) * (i + 1)
+        exit_pos.append((width - 1, center))
+        if center - 1 >= 0:
+            exit_pos.append((width - 1, center - 1))
+            if center - 2 >= 0:
+                exit_pos.append((width - 1, center - 2))
+        if center + 1 < height:
+            exit_pos.append((width - 1, center + 1))
+            if center + 2 < height:
+                exit_pos.append((width - 1, center + 2))
+    return exit_pos
+
+
+def parse_scenario(data):
+    """
+    Check a scenario given as a dict (cf. the module docstring) and fill in the default values
+
+    output :
+    - scenario : dict, with the keys name, width, height, exits, obstacles, n_agents, personality,
+      agent_locations, features, seed and max_steps (exits, obstacles and agent_locations as lists of tuples)
+    """
+    unknown = set(data) - {"name", "grid", "exits", "obstacles", "n_agents", "personality",
+                           "agent_locations", "features", "seed", "max_steps"}
+    if unknown:
+        raise ValueError(f"Unknown scenario keys: {sorted(unknown)}")
+
+    width, height = int(data["grid"]["width"]), int(data["grid"]["height"])
+
+    exits = data.get("exits", {})
+    if isinstance(exits, dict):
+        exits = generate_exits(width, height, **exits)
+    exits = [tuple(pos) for pos in exits]
+
+    personality = data.get("personality", "random")
+    if personality not in PERSONALITY_FUNCTIONS:
+        raise ValueError(f"Unknown personality distribution: {personality}, expected one of {list(PERSONALITY_FUNCTIONS)}")
+
+    features = dict(FEATURES)
+    unknown = set(data.get("features", {})) - set(FEATURES)
+    if unknown:
+        raise ValueError(f"Unknown scenario features: {sorted(unknown)}")
+    features.update(data.get("features", {}))
+
+    agent_locations = data.get("agent_locations")
+    return {
+        "name": data.get("name", "scenario"),
+        "width": width,
+        "height": height,
+        "exits": exits,
+        "obstacles": [tuple(pos) for pos in data.get("obstacles", [])],
+        "n_agents": int(data["n_agents"]),
+        "personality": personality,
+        "agent_locations": [tuple(pos) for pos in agent_locations] if agent_locations else False,
+        "features": features,
+        "seed": data.get("seed", 42),
+        "max_steps": data.get("max_steps"),
+    }
+
+
+def load_scenario(path):
+    """
+    Load and check a JSON scenario file (cf. parse_scenario)
+    """
+    with open(path, 'r') as f:
+        return parse_scenario(json.load(f))
@@ -0,0 +1,97 @@
+import numpy as np
+
+
+class SpatialHash:
+    """
+    Uniform grid (cell list) indexing agent positions.
+
+    Agents are bucketed in square cells of side cell_size, so that two agents closer than cell_size
+    are necessarily in the same cell or in two adjacent cells. Pairs of agents are then only looked
+    for among neighbouring cells, and the cost grows with the local density instead of N².
+    """
+
+    # The cell itself and half of its Moore neighborhood: each pair of adjacent cells is visited once
+    HALF_STENCIL = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.rebuild(np.empty((0, 2)))
+
+
+    def rebuild(self, positions, cell_size=None):
+        """
+        Rebuild the index from scratch
+
+        input :
+        - positions : array of shape (n, 2), the position of each indexed agent
+        - cell_size : float, optional new size of the buckets (e.g. when the cut-off changed)
+        """
+        if cell_size is not None:
+            self.cell_size = cell_size
+
+        self.positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        cells = np.floor(self.positions / self.cell_size).astype(np.int64)
+
+        if len(cells) > 0:
+            # Shift the cells so that the neighbours of any cell have positive coordinates,
+            # and leave an empty row at the top so that keys of different columns never overlap
+            self.origin = cells.min(axis=0) - 1
+            cells -= self.origin
+            self.stride = int(cells[:, 1].max()) + 2
+        else:
+            self.origin = np.zeros(2, dtype=np.int64)
+            self.stride = 1
+
+        self.cells = cells
+        self.keys = cells[:, 0] * self.stride + cells[:, 1]
+        self.order = np.argsort(self.keys, kind='stable')
+        self.sorted_keys = self.keys[self.order]
+
+        # rank[i] is the index of the i-th agent in the sorted order
+        self.rank = np.empty(len(self.keys), dtype=np.int64)
+        self.rank[self.order] = np.arange(len(self.keys))
+
+
+    def iter_candidate_pairs(self, max_pairs=2**22):
+        """
+        Yield (i, j) arrays of candidate pairs, i < j being indices in the positions given to rebuild.
+        Every pair of agents closer than cell_size is yielded exactly once, by chunks of at most
+        max_pairs pairs (except if one agent alone has more candidates) to bound the memory.
+        """
+        n = len(self.keys)
+        if n < 2:
+            return
+
+        for dx, dy in self.HALF_STENCIL:
+            neighbor_keys = self.keys + dx * self.stride + dy
+            end = np.searchsorted(self.sorted_keys, neighbor_keys, side='right')
+
+            if (dx, dy) == (0, 0):
+                # Inside the same cell only the agents after in the sorted order to count each pair once
+                start = self.rank + 1
+            else:
+                start = np.searchsorted(self.sorted_keys, neighbor_keys, side='left')
+
+            counts = np.maximum(end - start, 0)
+            cumulated = np.cumsum(counts)
+            if cumulated[-1] == 0:
+                continue
+
+            # Split the agents so that each chunk generates about max_pairs pairs
+            bounds = np.searchsorted(cumulated, np.arange(max_pairs, cumulated[-1], max_pairs), side='left')
+            bounds = np.unique(np.concatenate(([0], bounds + 1, [n])))
+            bounds = bounds[bounds <= n]
+
+            for first, last in zip(bounds[:-1], bounds[1:]):
+                chunk_counts = counts[first:last]
+                total = int(chunk_counts.sum())
+                if total == 0:
+                    continue
+
+                # Expand each agent's range [start, end) of the sorted array into explicit pairs
+                offsets = np.cumsum(chunk_counts) - chunk_counts
+                i = np.repeat(np.arange(first, last), chunk_counts)
+                j = self.order[np.repeat(start[first:last], chunk_counts)
+                               + np.arange(total) - np.repeat(offsets, chunk_counts)]
+
+                yield np.minimum(i, j), np.maximum(i, j)
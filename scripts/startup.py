@@ -0,0 +1,72 @@
+"""
+Cold-start budget of the simulation: time to import the model and to construct a CrowdModel
+in a fresh Python process, checked against a budget in seconds.
+
+Usage:
+    python startup.py --budget 5.0 --agents 100 --width 50 --height 50 [--no-fuzzy] [--repeat 3]
+
+The exit code is 1 when the median total time (import and construction) exceeds the budget, so that the check can be
+used in scripts. The first run fills the cache of the fuzzy system (cf. FuzzyModel.cached) and is
+not counted.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+
+def measure(n_agents, width, height, use_fuzzy):
+    """
+    Time the import of the model and the construction of a CrowdModel in the current process
+    """
+    start = time.perf_counter()
+    import random
+    from model import CrowdModel
+    imported = time.perf_counter()
+
+    personality = lambda: {trait: random.random() for trait in "OCEAN"}
+    CrowdModel(n_agents, width, height, obstacles=[], exit_pos=[(width - 1, height // 2)],
+               personality_function=personality, use_fuzzy=use_fuzzy)
+    constructed = time.perf_counter()
+
+    return {"import": imported - start, "construction": constructed - imported, "total": constructed - start}
+
+
+def measure_cold(args):
+    """
+    Run measure in a fresh Python process and return its timings
+    """
+    command = [sys.executable, __file__, "--child", "--agents", str(args.agents),
+               "--width", str(args.width), "--height", str(args.height)]
+    if args.no_fuzzy:
+        command.append("--no-fuzzy")
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the cold-start time of CrowdModel against a budget")
+    parser.add_argument("--budget", type=float, default=5.0, help="maximum total time in seconds")
+    parser.add_argument("--agents", type=int, default=100)
+    parser.add_argument("--width", type=int, default=50)
+    parser.add_argument("--height", type=int, default=50)
+    parser.add_argument("--no-fuzzy", action="store_true", help="construct the model with use_fuzzy=False")
+    parser.add_argument("--repeat", type=int, default=3, help="number of measured cold starts")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.agents, args.width, args.height, not args.no_fuzzy)))
+        sys.exit(0)
+
+    measure_cold(args) # warm up the caches
+    timings = sorted((measure_cold(args) for _ in range(args.repeat)), key=lambda timing: timing["total"])
+    median = timings[len(timings) // 2]
+
+    print(f"import: {median['import']:.3f}s, construction: {median['construction']:.3f}s, "
+          f"total: {median['total']:.3f}s (budget {args.budget:.3f}s)")
+    if median["total"] > args.budget:
+        print("Cold start over budget")
+        sys.exit(1)
+    print("Cold start within budget")
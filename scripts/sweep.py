@@ -0,0 +1,224 @@
+"""
+Parameter sweep: expands a grid of parameters over a base scenario (cf. scenario.py) into runs, with
+several replicates each, and runs them in parallel on a pool of processes.
+
+Sweep file example:
+{
+    "scenario": "../scenarios/example.json",
+    "parameters": {
+        "use_fuzzy": [true, false],
+        "enable_emotions": [true, false],
+        "n_agents": [100, 200],
+        "exits": [{"bottom": 1, "top": 0, "left": 0, "right": 1}, {"bottom": 2, "top": 2, "left": 0, "right": 0}]
+    },
+    "replicates": 10,
+    "seed": 0
+}
+"scenario" is the path of a scenario file (relative to the sweep file) or a scenario given inline. The parameters
+are the features of the scenario or its keys n_agents, personality, exits, obstacles and max_steps.
+
+Usage:
+    python sweep.py sweep.json --output results/sweep [--workers 8]
+
+The metrics of each run are written to their own file of the output directory as soon as the run ends,
+so that running the same sweep again after a crash only runs the missing runs. The name of the file holds
+a hash of the base scenario and of the seed of the sweep: changing them runs the sweep again.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from scenario import FEATURES, generate_exits, parse_scenario
+
+# Keys of the scenario a sweep can change, besides the features
+SCENARIO_PARAMETERS = ("n_agents", "personality", "exits", "obstacles", "max_steps")
+
+
+def run_seed(base_seed, replicate):
+    """
+    Seed of a replicate, derived from the seed of the sweep with a SeedSequence so that the seeds
+    of the replicates are independent. Replicate r of every configuration uses the same seed, so that
+    configurations are compared on the same random draws.
+    """
+    return int(np.random.SeedSequence([base_seed, replicate]).generate_state(1)[0])
+
+
+def base_key(scenario, base_seed):
+    """
+    Hash of what a sweep shares between its runs: the base scenario (but its seed, replaced by the seed of each run)
+    and the seed of the sweep, so that runs of another scenario or seed written in the same directory are not reused
+    """
+    scenario = {name: value for name, value in scenario.items() if name != "seed"}
+    key = json.dumps({"scenario": scenario, "seed": base_seed}, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:8]
+
+
+def run_id(parameters, replicate, base=""):
+    """
+    Name of a run, stable across executions of the sweep (used to resume it), base being the key of the base
+    scenario and seed of the sweep (cf. base_key)
+    """
+    key = json.dumps(parameters, sort_keys=True)
+    return f"run_{base}{'_' if base else ''}{hashlib.sha1(key.encode()).hexdigest()[:12]}_r{replicate:03d}"
+
+
+def expand_grid(parameters, replicates, base_seed=0, scenario=None):
+    """
+    Return the list of runs of the sweep, one per combination of parameter values and replicate
+
+    input :
+    - parameters : dict, for each parameter the list of its values
+    - replicates : int, the number of runs of each combination
+    - base_seed : int, the seed of the sweep
+    - scenario : dict, the base scenario (cf. run_sweep), whose key is part of the run ids
+
+    output :
+    - runs : list of dict with the keys run_id, base, parameters, replicate and seed
+    """
+    unknown = set(parameters) - set(FEATURES) - set(SCENARIO_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+
+    base = base_key(scenario, base_seed) if scenario is not None else ""
+    names = sorted(parameters)
+    runs = []
+    for values in itertools.product(*(parameters[name] for name in names)):
+        combination = dict(zip(names, values))
+        for replicate in range(replicates):
+            runs.append({
+                "run_id": run_id(combination, replicate, base),
+                "base": base,
+                "parameters": combination,
+                "replicate": replicate,
+                "seed": run_seed(base_seed, replicate),
+            })
+    return runs
+
+
+def with_parameters(scenario, parameters, seed):
+    """
+    Return a copy of a scenario (as returned by scenario.parse_scenario) with the parameters of a run
+    """
+    scenario = dict(scenario, features=dict(scenario["features"]), seed=seed)
+    for name, value in parameters.items():
+        if name in FEATURES:
+            scenario["features"][name] = value
+        elif name == "exits":
+            exits = generate_exits(scenario["width"], scenario["height"], **value) if isinstance(value, dict) else value
+            scenario["exits"] = [tuple(pos) for pos in exits]
+        elif name == "obstacles":
+            scenario["obstacles"] = [tuple(pos) for pos in value]
+        else:
+            scenario[name] = value
+    return scenario
+
+
+# State of a worker process, set once by init_worker and shared by all the runs of the worker
+_worker = {}
+
+
+def init_worker(scenario, use_fuzzy):
+    """
+    Initializer of the worker processes: keeps the base scenario (the static geometry) and loads the
+    fuzzy model of its features once, instead of once per run
+    """
+    _worker["scenario"] = scenario
+    _worker["fuzzy_models"] = {} # key: (fuzzy_mode, lut_resolution), value: FuzzyModel
+    if use_fuzzy:
+        worker_fuzzy_model(scenario["features"])
+
+
+def worker_fuzzy_model(features):
+    """
+    Fuzzy model of a run of the worker, loaded once per fuzzy mode and lookup table resolution
+    (None when the run does not use the fuzzy logic)
+    """
+    if not features["use_fuzzy"]:
+        return None
+    key = (features["fuzzy_mode"], features["lut_resolution"])
+    if key not in _worker["fuzzy_models"]:
+        from fuzzy import FuzzyModel
+        _worker["fuzzy_models"][key] = FuzzyModel.cached(use_lookup_table=key[0] == "lookup", lut_resolution=key[1])
+    return _worker["fuzzy_models"][key]
+
+
+def execute_run(run, output_dir):
+    """
+    Run one run of the sweep in a worker and write its result, return the path of the result file
+    """
+    from headless import run_scenario
+
+    scenario = with_parameters(_worker["scenario"], run["parameters"], run["seed"])
+    metrics = run_scenario(scenario, fuzzy_model=worker_fuzzy_model(scenario["features"]))
+    result = dict(run, metrics=metrics)
+
+    # Write then rename, so that an interrupted sweep never leaves a partial result
+    path = os.path.join(output_dir, f"{run['run_id']}.json")
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(result, f)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def run_sweep(scenario, parameters, replicates, output_dir, base_seed=0, max_workers=None):
+    """
+    Run the runs of a sweep that have no result yet in output_dir, and return the results of all the runs
+
+    input :
+    - scenario : dict, the base scenario as returned by scenario.parse_scenario
+    - parameters, replicates, base_seed : cf. expand_grid
+    - output_dir : str, the directory of the result files
+    - max_workers : int, the number of worker processes (number of CPUs by default)
+
+    output :
+    - results : list of dict, for each run its run_id, base, parameters, replicate, seed and metrics
+      (cf. headless.run_scenario), runs that failed being left out
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    runs = expand_grid(parameters, replicates, base_seed, scenario)
+    pending = [run for run in runs if not os.path.exists(os.path.join(output_dir, f"{run['run_id']}.json"))]
+    print(f"{len(runs)} runs, {len(runs) - len(pending)} already done")
+
+    if pending:
+        use_fuzzy = scenario["features"]["use_fuzzy"] or True in parameters.get("use_fuzzy", [])
+        with ProcessPoolExecutor(max_workers, initializer=init_worker, initargs=(scenario, use_fuzzy)) as executor:
+            futures = {executor.submit(execute_run, run, output_dir): run for run in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                run = futures[future]
+                try:
+                    future.result()
+                    print(f"[{done}/{len(pending)}] {run['run_id']} done")
+                except Exception as e:
+                    print(f"[{done}/{len(pending)}] {run['run_id']} failed: {e}")
+
+    results = []
+    for run in runs:
+        path = os.path.join(output_dir, f"{run['run_id']}.json")
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                results.append(json.load(f))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of crowd simulations")
+    parser.add_argument("sweep", help="path of the JSON sweep file")
+    parser.add_argument("--output", required=True, help="directory of the result files")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    with open(args.sweep, 'r') as f:
+        sweep = json.load(f)
+    base = sweep["scenario"]
+    if isinstance(base, str):
+        with open(os.path.join(os.path.dirname(os.path.abspath(args.sweep)), base), 'r') as f:
+            base = json.load(f)
+
+    results = run_sweep(parse_scenario(base), sweep["parameters"], sweep.get("replicates", 1), args.output,
+                        sweep.get("seed", 0), args.workers)
+    print(f"{len(results)} results in {args.output}")
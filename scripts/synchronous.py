@@ -0,0 +1,190 @@
+import numpy as np
+from mesa.time import BaseScheduler
+
+from density import DensityField
+
+# Directions of the moves, in the order of PedestrianAgent.get_cells_around
+DIRECTIONS = np.array([(0, 1), (1, 1), (1, 0), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+
+
+class SynchronousActivation(BaseScheduler):
+    """
+    Synchronous update of the pedestrians, an alternative to RandomActivation for large crowds.
+
+    A step is done in three phases working on the columns of the AgentStore of the model:
+    1. the pedestrians on an exit leave, as in PedestrianAgent.step
+    2. every other pedestrian scores its candidate cells (cf. PedestrianAgent.get_cells_around and choose_move)
+       against a snapshot of the grid taken after the exits, all at once
+    3. the pedestrians competing for the same cell are settled: the best score gets the cell, ties being
+       broken by a random priority drawn from the model's random generator. The others choose again among
+       their cells not taken yet, until every pedestrian has a cell (at worst its own, which nobody else can take),
+       then all the moves are committed
+
+    Unlike the sequential activation, a pedestrian does not see the moves of the others of the same step:
+    the trajectories of the step do not block the paths, and the densities are those of the snapshot.
+    The metrics (needed_steps_per_agents, max_density_per_episode) are filled in the same way.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self._by_slot = {} # key: slot in the AgentStore, value: agent
+        # Densities of the snapshot when the model has no density field (density_mode "scan")
+        self._density_field = None
+
+
+    def add(self, agent):
+        super().add(agent)
+        self._by_slot[agent.slot] = agent
+
+
+    def remove(self, agent):
+        super().remove(agent)
+        del self._by_slot[agent.slot]
+
+
+    def step(self):
+        model = self.model
+        store = model.agent_store
+        profiler = model.profiler
+
+        slots = store.active_slots()
+        self._exit(slots[model.grid.exit_layer[store.pos[slots, 0], store.pos[slots, 1]] > 0])
+        store.p[slots] = 0 # reset of the densities, as in PedestrianAgent.step
+
+        slots = store.active_slots()
+        if len(slots):
+            xs, ys, valid, scores, real_densities = self._score_candidates(slots)
+            choice, rounds, conflicts = self._settle(xs, ys, scores)
+            self._commit(slots, xs, ys, choice, real_densities)
+            if profiler is not None:
+                profiler.count("agent_moves", len(slots))
+                profiler.count("candidates", int(valid.sum()))
+                profiler.count("conflict_rounds", rounds)
+                profiler.count("conflicts", conflicts)
+
+        self.steps += 1
+        self.time += 1
+
+
+    def _exit(self, slots):
+        """Remove the pedestrians of the given slots, which are on an exit"""
+        model = self.model
+        for slot in slots.tolist():
+            agent = self._by_slot[slot]
+            model.remove_pedestrian(agent)
+            model.needed_steps_per_agents[agent.unique_id] = model.nb_steps
+        if model.profiler is not None:
+            model.profiler.count("evacuated", len(slots))
+
+
+    def _score_candidates(self, slots):
+        """
+        Candidate cells of the pedestrians of the given slots and their scores
+
+        output :
+        - xs, ys : arrays of int, A x K, the candidate cells of each pedestrian (the last one being its own cell)
+        - valid : array of bool, A x K, whether each candidate can be reached
+        - scores : array of float, A x K, the score of each candidate (inf for the ones that can not be chosen)
+        - real_densities : array of float, A x K, the real density of each candidate
+        """
+        model = self.model
+        store = model.agent_store
+        grid = model.grid
+
+        pos = store.pos[slots]
+        vel0 = store.vel0[slots]
+        distances = np.arange(1, vel0.max() + 1)
+
+        # Cells at distance 1 to vel0 in each direction: A x 8 x V
+        cx = pos[:, 0, None, None] + DIRECTIONS[None, :, 0, None] * distances[None, None, :]
+        cy = pos[:, 1, None, None] + DIRECTIONS[None, :, 1, None] * distances[None, None, :]
+        inside = (cx >= 0) & (cx < grid.width) & (cy >= 0) & (cy < grid.height)
+        free = inside.copy()
+        free[inside] = grid.blocked_layer[cx[inside], cy[inside]] == 0
+        # A direction is followed until the first blocked cell, and up to the speed of the pedestrian
+        reachable = np.logical_and.accumulate(free, axis=2) & (distances[None, None, :] <= vel0[:, None, None])
+
+        n = len(slots)
+        xs = np.concatenate((np.where(reachable, cx, 0).reshape(n, -1), pos[:, :1]), axis=1)
+        ys = np.concatenate((np.where(reachable, cy, 0).reshape(n, -1), pos[:, 1:]), axis=1)
+        valid = np.concatenate((reachable.reshape(n, -1), np.ones((n, 1), dtype=bool)), axis=1)
+
+        field = model.density_field
+        if field is None:
+            if self._density_field is None:
+                self._density_field = DensityField(grid.width, grid.height)
+            field = self._density_field
+            field.rebuild(pos)
+        densities, real_densities = field.densities(xs, ys)
+
+        pd = store.pd[slots, None]
+        pv = store.pv[slots, None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores = model.goal_distance(xs, ys) / (vel0[:, None] * np.exp(- densities * (pv+1) / (pd+1)))
+        scores[np.isnan(scores) | ~valid] = np.inf
+        return xs, ys, valid, scores, real_densities
+
+
+    def _settle(self, xs, ys, scores):
+        """
+        Give a cell to every pedestrian, return the index of the chosen candidate of each of them,
+        the number of rounds and the number of times a pedestrian lost a cell to another one
+        """
+        n, k = scores.shape
+        height = self.model.grid.height
+        scores = scores.copy()
+        priority = np.random.default_rng(self.model.random.getrandbits(64)).permutation(n)
+        choice = np.full(n, k - 1)
+        taken = np.zeros(self.model.grid.width * height, dtype=bool)
+
+        pending = np.arange(n)
+        rounds = conflicts = 0
+        while len(pending):
+            rounds += 1
+            # Cells taken in the previous rounds can not be chosen anymore
+            candidates = scores[pending]
+            candidates[taken[xs[pending] * height + ys[pending]]] = np.inf
+            scores[pending] = candidates
+
+            # Same choice as choose_move: the first best candidate, the own cell if no score is finite
+            best = np.argmin(candidates, axis=1)
+            best_score = candidates[np.arange(len(pending)), best]
+            moving = np.isfinite(best_score) & (best != k - 1)
+            pending, best, best_score = pending[moving], best[moving], best_score[moving]
+
+            # For each cell, the pedestrian with the best score (then the best priority) gets it
+            cells = xs[pending, best] * height + ys[pending, best]
+            order = np.lexsort((priority[pending], best_score, cells))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = cells[order][1:] != cells[order][:-1]
+            winners = order[first]
+
+            choice[pending[winners]] = best[winners]
+            taken[cells[winners]] = True
+            conflicts += len(order) - len(winners)
+            pending = pending[order[~first]]
+        return choice, rounds, conflicts
+
+
+    def _commit(self, slots, xs, ys, choice, real_densities):
+        """Move every pedestrian to its chosen cell, and fill its velocity, the trajectories and the maximal density"""
+        model = self.model
+        store = model.agent_store
+        rows = np.arange(len(slots))
+        origins = store.pos[slots]
+        targets = np.stack((xs[rows, choice], ys[rows, choice]), axis=1)
+
+        model.max_density_per_episode = max(model.max_density_per_episode, float(real_densities[rows, choice].max()))
+        store.vel[slots] = np.abs(targets - origins)
+
+        moved = np.flatnonzero((targets != origins).any(axis=1))
+        for i in moved.tolist():
+            model.move_pedestrian(self._by_slot[int(slots[i])], (int(targets[i, 0]), int(targets[i, 1])))
+
+        # Cells crossed by each move, from its origin (included) to its target (excluded)
+        steps = np.sign(targets[moved] - origins[moved])
+        lengths = np.abs(targets[moved] - origins[moved]).max(axis=1)
+        for distance in range(int(lengths.max()) if len(moved) else 0):
+            crossing = lengths > distance
+            cells = origins[moved][crossing] + distance * steps[crossing]
+            model.trajectories.add_many(cells[:, 0], cells[:, 1], store.unique_id[slots[moved][crossing]])
@@ -1,13 +1,36 @@
-from mesa import Agent
+import numpy as np
 
-class Trajectory(Agent):
+class TrajectoryLayer:
     """
-    A class to represent a trajectory of an agent, it will act as temporary obstacle
+    A class to represent the trajectories of the agents during the current step, they act as temporary obstacles.
+
+    The cells crossed by the agents are stored in a raster holding the id of the agent (or -1),
+    and the crossed cells are remembered so that clearing the layer only visits them.
     """
 
-    trajectory_counter = 0 # class variable to count the number of trajectories and give them unique id
-    def __init__(self, model, agent_id):
-        Trajectory.trajectory_counter += 1
-        super().__init__(Trajectory.trajectory_counter, model)
-        self.agent_id = agent_id
+    def __init__(self, width, height):
+        self.agent_ids = np.full((width, height), -1, dtype=np.int64)
+        self.touched = [] # flat indices of the cells holding a trajectory
+
+    def add(self, pos, agent_id):
+        """Mark the cell pos as crossed by the agent agent_id"""
+        if self.agent_ids[pos] < 0:
+            self.touched.append(pos[0] * self.agent_ids.shape[1] + pos[1])
+        self.agent_ids[pos] = agent_id
+
+    def add_many(self, xs, ys, agent_ids):
+        """Mark the cells (xs[i], ys[i]) as crossed by the agents agent_ids[i] (the last one when a cell is given twice)"""
+        flat = np.asarray(xs) * self.agent_ids.shape[1] + np.asarray(ys)
+        self.touched.extend(np.unique(flat[self.agent_ids.ravel()[flat] < 0]).tolist())
+        self.agent_ids.ravel()[flat] = agent_ids
+
+    def clear(self):
+        """Remove all the trajectories"""
+        self.agent_ids.ravel()[self.touched] = -1
+        self.touched = []
 
+    def __iter__(self):
+        """Iterate over the (x, y, agent_id) of the trajectories"""
+        for index in self.touched:
+            x, y = divmod(index, self.agent_ids.shape[1])
+            yield x, y, int(self.agent_ids[x, y])
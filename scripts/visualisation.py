@@ -1,11 +1,12 @@
+import logging
 import random
 from mesa.visualization.modules import CanvasGrid
 from mesa.visualization.ModularVisualization import ModularServer
 from agents import PedestrianAgent
 from model import CrowdModel # type: ignore
 from obstacle import Obstacle
-from trajectory import Trajectory
 from exit import Exit
+from scenario import PERSONALITY_FUNCTIONS, generate_exits, random_personality
 
 def highest_trait(agent):
     """
@@ -68,18 +69,7 @@ def agent_portrayal(agent):
             "Layer": 0,
         }
     
-    if isinstance(agent, Trajectory):
-        colors = ["black", "blue", "green", "yellow", "purple", "orange", "brown", "black"]
-
-        return {
-            "Shape": "circle",
-            "Filled": "false",
-            "r": 0.1,
-            "Color": colors[agent.agent_id % len(colors)],
-            "Layer": 1  ,
-        }
-    
-    elif isinstance(agent, Exit):
+    if isinstance(agent, Exit):
         return {
             "Shape": "/home/alexis-le-s/Cours/S5/Colletive_Behavior/CollectiveBehavior-Crowd-modeling/assets/exit.gif",
             "Filled": "false",
@@ -91,36 +81,30 @@ def agent_portrayal(agent):
     return {}
 
 
-def random_personality():
-        personality = {}
-        for trait in ['O', 'C', 'E', 'A', 'N']:
-            mu = random.uniform(0, 1)
-            sigma = random.uniform(-0.1, 0.1)
-            personality[trait] = random.gauss(mu, sigma**2)
-            # Personality[trait] = max(0, min(1, random.gauss(mu, abs(sigma))))
-        return personality
+def trajectory_portrayal(agent_id):
+    colors = ["black", "blue", "green", "yellow", "purple", "orange", "brown", "black"]
 
+    return {
+        "Shape": "circle",
+        "Filled": "false",
+        "r": 0.1,
+        "Color": colors[agent_id % len(colors)],
+        "Layer": 1  ,
+    }
 
-def full_N():
-    personality = {}
-    for trait in ['O', 'C', 'E', 'A', 'N']:
-        if trait == 'N':
-            personality[trait] = 1
-        else:
-            mu = random.uniform(0, 1)
-            sigma = random.uniform(-0.1, 0.1)
-            personality[trait] = random.gauss(mu, sigma**2)
-    return personality
 
-
-def only_N():
-    personality = {}
-    for trait in ['O', 'C', 'E', 'A', 'N']:
-        if trait == 'N':
-            personality[trait] = 1
-        else:
-            personality[trait] = 0
-    return personality
+class TrajectoryCanvasGrid(CanvasGrid):
+    """
+    CanvasGrid also drawing the trajectories of the model, which are not agents of the grid
+    """
+    def render(self, model):
+        grid_state = super().render(model)
+        for x, y, agent_id in model.trajectories:
+            portrayal = trajectory_portrayal(agent_id)
+            portrayal["x"] = x
+            portrayal["y"] = y
+            grid_state[portrayal["Layer"]].append(portrayal)
+        return grid_state
 
 
 def run_visualisation(nb_agents, width, height, obstacles, exit_pos, personality, agent_locations):
@@ -133,7 +117,7 @@ def run_visualisation(nb_agents, width, height, obstacles, exit_pos, personality
     enable_relationships = True  
     enable_clustering = True  
 
-    grid = CanvasGrid(agent_portrayal, width, height, 1000, 1000)
+    grid = TrajectoryCanvasGrid(agent_portrayal, width, height, 1000, 1000)
     server = ModularServer(
         CrowdModel,
         [grid],
@@ -156,6 +140,9 @@ def run_visualisation(nb_agents, width, height, obstacles, exit_pos, personality
     server.launch()
 
 if __name__ == "__main__":
+    # Show the progress of the simulation in the terminal (level DEBUG for more details)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
     # Interactive menu
     agents = int(input("Enter the number of agents (default 400): ") or 400)
     width = int(input("Enter the width of the grid (default 100): ") or 100)
@@ -168,59 +155,11 @@ if __name__ == "__main__":
         "Choose the personality function (random, fully N, only N; default 'random'): "
     ) or "random"
 
-    exit_pos = []
-    for i in range(exit_bottom):
-        center = width // (exit_bottom + 1) * (i + 1)
-        exit_pos.append((center, 0))
-        if center - 1 >= 0:
-            exit_pos.append((center - 1, 0))
-            if center - 2 >= 0:
-                exit_pos.append((center - 2, 0))
-        if center + 1 <= width:
-            exit_pos.append((center + 1, 0))
-            if center + 2 < width:
-                exit_pos.append((center + 2, 0))
-    for i in range(exit_top):
-        center = width // (exit_bottom + 1) * (i + 1)
-        exit_pos.append((center, height - 1))
-        if center - 1 >= 0:
-            exit_pos.append((center - 1, height - 1))
-            if center - 2 >= 0:
-                exit_pos.append((center - 2, height - 1))
-        if center + 1 <= width:
-            exit_pos.append((center + 1, height - 1))
-            if center + 2 < width:
-                exit_pos.append((center + 2, height - 1))
-    for i in range(exit_left):
-        center = height // (exit_left + 1) * (i + 1)
-        exit_pos.append((0, center))
-        if center - 1 >= 0:
-            exit_pos.append((0, center - 1))
-            if center - 2 >= 0:
-                exit_pos.append((0, center - 2))
-        if center + 1 <= width:
-            exit_pos.append((0, center + 1))
-            if center + 2 < width:
-                exit_pos.append((0, center + 2))
-    for i in range(exit_right):
-        center = height // (exit_right + 1) * (i + 1)
-        exit_pos.append((width - 1, center))
-        if center - 1 >= 0:
-            exit_pos.append((width - 1, center - 1))
-            if center - 2 >= 0:
-                exit_pos.append((width - 1, center - 2))
-        if center + 1 <= width:
-            exit_pos.append((width - 1, center + 1))
-            if center + 2 < width:
-                exit_pos.append((width - 1, center + 2))
+    exit_pos = generate_exits(width, height, exit_bottom, exit_top, exit_left, exit_right)
 
     # Set the personality function based on user input
-    if personality_choice == "random":
-        personality_function = random_personality
-    elif personality_choice == "fully N":
-        personality_function = full_N
-    elif personality_choice == "only N":
-        personality_function = only_N
+    if personality_choice in PERSONALITY_FUNCTIONS:
+        personality_function = PERSONALITY_FUNCTIONS[personality_choice]
     else:
         print("Invalid choice, defaulting to 'random'")
         personality_function = random_personality